@@ -2,13 +2,18 @@ import hashlib
 import json
 import os.path
 import shutil
+import time
 import uuid
 import warnings
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from fractions import Fraction
+from itertools import islice
 from os.path import join
 import ffmpeg
 import pandas as pd
+from bokeh.document import Document
+from bokeh.events import DocumentReady
 from bokeh.io import show, output_file
 from bokeh.layouts import column, row
 from bokeh.models import ColumnDataSource, CDSView, Select, CustomJS, HoverTool, LayoutDOM, Slider, Button, Div, LegendItem
@@ -19,12 +24,26 @@ import logging
 from BokehBioImageDataVis.src.bokeh_helpers.get_bokeh_images_base64 import get_pan_tool_image, get_rect_zoom_image, \
     get_mouse_wheel_image, get_reset_image, get_hover_tool_image
 from BokehBioImageDataVis.src.colormapping import random_color
+from BokehBioImageDataVis.src.data_payload import PATH_PREFIX_SUFFIX, PATH_PREFIX_TAG, encode_path_column, \
+    write_payload
+from BokehBioImageDataVis.src.export_manifest import ExportManifest, stat_signature
 from BokehBioImageDataVis.src.ffmpeg_config import build_ffmpeg_output_stream, resolve_ffmpeg_output_kwargs
-from BokehBioImageDataVis.src.file_handling import copy_files_to_output_dir, create_file, sanitize_media_path_column, \
+from BokehBioImageDataVis.src.file_handling import COPY_FILES_LAYOUTS, COPY_FILES_LINK_MODES, DirectoryIndex, \
+    apply_path_mapping, copy_files_to_output_dir, create_file, hash_file, sanitize_media_path_column, \
     sanitize_media_path_value
-from BokehBioImageDataVis.src.html_snippets import BBDV_DOM_HELPER_JS, image_html_and_callback, \
-    text_html_and_callback, video_html_and_callback
-from BokehBioImageDataVis.src.utils import identify_numerical_variables
+from BokehBioImageDataVis.src.html_snippets import BBDV_DOM_HELPER_JS, PREFETCH_ROWS, helpers_model, \
+    image_html, image_link_update_js, media_prefetch_js, payload_load_js, scheduled_row_refresh_js, \
+    text_html_and_update_js, text_keys_to_show, video_html, video_poster_update_js
+from BokehBioImageDataVis.src.image_derivatives import IMAGE_DERIVATIVE_FORMATS, build_image_derivatives, \
+    derivative_extension, require_pillow, run_in_pool
+from BokehBioImageDataVis.src.mp4_boxes import moov_after_mdat
+from BokehBioImageDataVis.src.probe_cache import ProbeCache
+from BokehBioImageDataVis.src.tiff_conversion import Z_PROJECTIONS, convert_tiff_for_display, is_tiff_path, \
+    normalize_contrast_limits, parse_channel_color, require_tifffile
+from BokehBioImageDataVis.src.utils import compact_numeric_columns, identify_numerical_variables
+
+
+VIDEO_POSTER_FORMATS = ('jpg', 'webp')
 
 
 def _make_cds_view(source):
@@ -44,8 +63,26 @@ class BokehBioImageDataVis:
                  category_key=None,
                  dropdown_options=None,
                  add_id_to_dataframe=True,
+                 prune_unused_columns=True,
+                 external_data=False,
+                 compact_columns=False,
+                 dictionary_encode_paths=False,
+                 compact_columns_tolerance=None,
                  do_copy_files_to_output_dir=True,
+                 copy_files_workers=1,
+                 copy_files_layout='tree',
+                 copy_files_link_mode='copy',
                  copy_files_dir_level=1,
+                 video_encode_workers=1,
+                 ffmpeg_threads=None,
+                 faststart_videos=False,
+                 video_dwell_ms=0,
+                 image_derivative_workers=None,
+                 image_derivative_processes=False,
+                 use_export_manifest=True,
+                 export_manifest_hashes=False,
+                 use_probe_cache=True,
+                 probe_cache_path=None,
                  clearOutputFolderIfNotEmpty=False,
                  legend_position = "bottom_right",
                  legend_title=None,
@@ -66,8 +103,45 @@ class BokehBioImageDataVis:
         :param category_key: if a category key is given, the scatter points are colored according to this key
         :param dropdown_options: can be used to filter the dropdown options to only relevant ones, list of strings
         :param add_id_to_dataframe: add an id column to the dataframe, which can be used with the slider
+        :param prune_unused_columns: only write the columns used by the page (axes, media, hover text, colors,
+            markers, legend, id) into the html, other columns of the dataframe are dropped when showing the page
+        :param external_data: write the scatter data to a sidecar script in data/data_payloads instead of the html,
+            the page loads it once the layout is painted. Keeps the html small and fast to open for large tables
+        :param compact_columns: store numeric columns with smaller dtypes in the page: floats as float32 (if that
+            changes no value by more than compact_columns_tolerance), integers in the smallest type holding their range
+        :param compact_columns_tolerance: largest absolute change of a float value allowed by compact_columns,
+            defaults to half of the last digit shown with scatter_data_hover_float_precision
+        :param dictionary_encode_paths: store media path columns in the page as a table of directories plus one
+            directory code and the file name per row, instead of repeating the full path in every row
         :param do_copy_files_to_output_dir: copy files to output dir, relative paths, to make everything portable
+        :param copy_files_workers: number of threads used to copy files to the output dir, 1 copies serially
+        :param copy_files_layout: 'tree' preserves the folder structure (see copy_files_dir_level), 'content' stores
+            files under data/content/ named by a hash of their content, so identical files are only stored once
+        :param copy_files_link_mode: how files end up in the output dir, can be 'copy', 'hardlink', 'reflink',
+            'symlink'; links fall back to copying if not supported (e.g. different file systems).
+            'symlink' makes the output folder non-portable
         :param copy_files_dir_level: how many levels of the folder structure should be preserved when copying files
+        :param video_encode_workers: number of video encodes (ffmpeg processes, e.g. for stacked video hovers) that
+            run concurrently
+        :param ffmpeg_threads: total number of threads the concurrent ffmpeg encodes may use, split evenly between
+            them. Defaults to the number of cpus when several workers are used, otherwise ffmpeg decides
+        :param faststart_videos: remux (stream copy, no re-encode) videos whose moov atom comes after the media data,
+            so that browsers can start playing them before the whole file is loaded. Needs ffmpeg
+        :param video_dwell_ms: milliseconds the mouse (or slider) has to rest on a point before the videos switch to
+            it, avoids starting a video load for every point passed during fast sweeps. 0 switches immediately
+        :param image_derivative_workers: number of threads (or processes, see image_derivative_processes) used to
+            create display images for image hovers (tiff rendering and add_image_hover(thumbnail=True)), defaults to
+            the number of cpus
+        :param image_derivative_processes: create the display images in worker processes instead of threads. Can be
+            faster for many large images, but on Windows and macOS the script creating the page then needs an
+            if __name__ == '__main__': guard
+        :param use_export_manifest: keep a manifest of copied media in the output folder, so that re-running the
+            export only touches media whose source changed (size or modification time)
+        :param export_manifest_hashes: additionally store content hashes in the manifest, so that files which were
+            only touched (new modification time, same content) are not copied again
+        :param use_probe_cache: keep video probe results (size, frame count, fps) in a persistent cache, so that
+            unchanged videos are never probed twice, also across different exports
+        :param probe_cache_path: path of the probe cache database, defaults to a file in the user cache directory
         :param clearOutputFolderIfNotEmpty: if output folder is not empty, delete contents
         :param legend_position: position of the legend, can be 'bottom_right', 'bottom_left', 'top_left', 'top_right', 'outside'
         :param legend_title: title of the legend
@@ -80,6 +154,14 @@ class BokehBioImageDataVis:
 
         self.df = df.copy()
         self.add_id_to_dataframe = add_id_to_dataframe
+        self.prune_unused_columns = prune_unused_columns
+        self.external_data = external_data
+        self.compact_columns = compact_columns
+        if compact_columns_tolerance is None:
+            compact_columns_tolerance = 0.5 * 10 ** -scatter_data_hover_float_precision
+        self.compact_columns_tolerance = compact_columns_tolerance
+        self.dictionary_encode_paths = dictionary_encode_paths
+        self.payload_load_callback = None
 
         if category_key:
             logging.info(f'Category key: {category_key}')
@@ -132,22 +214,40 @@ class BokehBioImageDataVis:
         # touple of id and update function
         self.registered_text_elements = []
         self.dataset_selector = None
+        self.dataset_selector_callback = None
         self.dataset_sources = []
         self.dataset_labels = []
         self.dataset_legend_items = []
 
         self.scatter_marker_key = 'circle'
+        self.scatter_color_key = None
         self.scatter_color_legend_key = None
         self.scatter_marker_legend_key = None
         self.row_refresh_js = None
         self.main_scatter_renderer = None
         self.scatter_legend = None
+        self.hover_tool = None
+        # shared js helpers, installed once per page by whichever callback runs first
+        self.bbdv_helpers = helpers_model()
 
         # copy needed files relative to the output dir, e.g. for videos
         # makes the visualisation portable, but also increases the size of the output dir
         # additionally, some of the folder structure may be renamed to resolve uniqueness issues
         logging.info(f'Copy files to output dir: {do_copy_files_to_output_dir}')
         self.do_copy_files_to_output_dir = do_copy_files_to_output_dir
+        # copying is mostly I/O bound, so several threads help a lot on network storage
+        logging.info(f'Copy files workers: {copy_files_workers}')
+        self.copy_files_workers = copy_files_workers
+
+        assert copy_files_layout in COPY_FILES_LAYOUTS, (f'copy_files_layout must be in {COPY_FILES_LAYOUTS}, got '
+                                                         f'{copy_files_layout}')
+        assert copy_files_link_mode in COPY_FILES_LINK_MODES, (f'copy_files_link_mode must be in '
+                                                               f'{COPY_FILES_LINK_MODES}, got {copy_files_link_mode}')
+        logging.info(f'Copy files layout: {copy_files_layout}, link mode: {copy_files_link_mode}')
+        self.copy_files_layout = copy_files_layout
+        self.copy_files_link_mode = copy_files_link_mode
+        if copy_files_link_mode == 'symlink':
+            logging.warning('Symlinked media point to the original files, the output folder is not portable.')
 
         # to keep some organisation, do not only copy the files, but preserve the folder structure up to the
         # specified level
@@ -155,10 +255,37 @@ class BokehBioImageDataVis:
         self.copy_files_dir_level = copy_files_dir_level
         self.used_paths = []  # paths that are already used for data saving/copying (so that there are no duplicates appearing)
         self.copied_paths_by_source = {}  # reuse already copied media when the same source path appears again
+        self.copied_sources_by_output = {}
+        self.copied_sources_synced = 0  # number of copies already mapped back in copied_sources_by_output
         self.generated_media_keys = set()
+        self.ensured_placeholders = {}
+        # shared by all media columns and datasets of this export, avoids one stat call per row
+        self.directory_index = DirectoryIndex()
+
+        self.export_manifest_hashes = export_manifest_hashes
+        if use_export_manifest:
+            self.export_manifest = ExportManifest(self.output_folder)
+        else:
+            self.export_manifest = None
+        self.probe_cache = ProbeCache(probe_cache_path if use_probe_cache else ':memory:')
         self.stacked_video_specs = {}
         self.stacked_video_output_cache = {}
         self.stacked_video_reference_info_cache = {}
+        self.web_video_specs = {}
+        self.web_video_output_cache = {}
+        self.video_poster_specs = {}
+        self.video_poster_output_cache = {}
+        self.video_encode_workers = max(1, int(video_encode_workers))
+        self.ffmpeg_threads = ffmpeg_threads
+        self.faststart_videos = faststart_videos
+        self.faststart_output_cache = {}
+        self.video_dwell_ms = max(0, int(video_dwell_ms))
+        self.image_derivative_workers = image_derivative_workers or os.cpu_count() or 1
+        self.image_derivative_processes = image_derivative_processes
+        self.image_thumbnail_specs = {}
+        self.image_thumbnail_output_cache = {}
+        self.tiff_display_specs = {}
+        self.tiff_display_output_cache = {}
 
         self.non_data_keys = []
         self.path_keys = []
@@ -205,19 +332,107 @@ class BokehBioImageDataVis:
     def show_bokeh(self, obj: LayoutDOM):
         # self.scatter_figure.toolbar_location = None
         self.add_hover_highlight()
+        if self.prune_unused_columns:
+            self._prune_unused_columns()
+        # encoding and moving the data out only applies to the saved page, the sources are restored afterwards
+        saved_sources = [(source, dict(source.data), list(source.tags))
+                         for source in [self.csd_source] + self.dataset_sources]
+        if self.dictionary_encode_paths:
+            self._dictionary_encode_paths()
+        if self.external_data:
+            # the page is saved with empty columns, the data follows from the sidecar payload
+            self._move_data_to_payload(obj)
         show(obj)
+        for source, source_data, source_tags in saved_sources:
+            source.data = source_data
+            source.tags = source_tags
+
+        if self.export_manifest is not None:
+            self.export_manifest.save()
 
         # create a file that reminds the user to unzip the data folder, this was a common issue
         create_file(filename=join(self.output_folder, 'PLEASE_MAKE_SURE_IM_UNZIPPED.txt'),
                     content="Please make sure to unzip the data folder before opening the html file.")
 
+    def _dictionary_encode_paths(self):
+        # media path columns only, paths shown in a hover text are read as they are
+        text_keys = set()
+        for registered_element in self.registered_text_elements:
+            text_keys.update(registered_element['shown_keys'])
+        path_keys = set()
+        for registered_element in self.registered_image_elements + self.registered_video_elements:
+            path_keys.update(registered_element.get(key) for key in ('key', 'link_key', 'poster_key'))
+        path_keys -= text_keys
+        path_keys.discard(None)
+
+        for source in [self.csd_source] + self.dataset_sources:
+            data = dict(source.data)
+            tags = list(source.tags)
+            for key in sorted(path_keys):
+                if key not in data:
+                    continue
+                prefixes, codes, basenames = encode_path_column(data[key])
+                data[key] = basenames
+                data[f'{key}{PATH_PREFIX_SUFFIX}'] = codes
+                tags.append([PATH_PREFIX_TAG, key, prefixes])
+            source.data = data
+            source.tags = tags
+
+    def _move_data_to_payload(self, obj):
+        payload_id, payload_path = write_payload(self.output_folder, self.csd_source.data)
+        logging.info(f'Wrote scatter data to {payload_path}.')
+        self.csd_source.data = {key: [] for key in self.csd_source.data}
+        if self.dataset_selector_callback is not None:
+            # every dataset gets its own payload, the default dataset shares the one of the main source
+            dataset_payloads = []
+            for dataset_source in self.dataset_sources:
+                dataset_payload_id, dataset_payload_path = write_payload(self.output_folder, dataset_source.data)
+                dataset_payloads.append([dataset_payload_path, dataset_payload_id])
+                dataset_source.data = {key: [] for key in dataset_source.data}
+            self.dataset_selector_callback.args = dict(self.dataset_selector_callback.args,
+                                                       dataset_payloads=dataset_payloads)
+
+        payload_load_code = BBDV_DOM_HELPER_JS + payload_load_js(payload_path, payload_id)
+        if self.payload_load_callback is not None:
+            self.payload_load_callback.code = payload_load_code
+            return
+        self.payload_load_callback = CustomJS(args=dict(source=self.csd_source, bbdv_helpers=self.bbdv_helpers),
+                                              code=payload_load_code)
+        document = obj.document
+        if document is None:
+            document = Document()
+            document.add_root(obj)
+        document.js_on_event(DocumentReady, self.payload_load_callback)
+
+    def _used_columns(self):
+        # columns read by the page: axes, media, hover text, color/marker/legend and the id
+        used_columns = {'id', self.x_axis_key, self.y_axis_key, 'legend', 'color_mapping'}
+        used_columns.update(self.dropdown_options)
+        used_columns.update(key for key in (self.category_key, self.scatter_color_key, self.scatter_marker_key,
+                                            self.scatter_color_legend_key, self.scatter_marker_legend_key)
+                            if key is not None)
+        for registered_element in self.registered_image_elements + self.registered_video_elements:
+            used_columns.update(registered_element.get(key) for key in ('key', 'link_key', 'poster_key'))
+        for registered_element in self.registered_text_elements:
+            used_columns.update(registered_element['shown_keys'])
+        used_columns.discard(None)
+        return used_columns
+
+    def _prune_source(self, source, used_columns):
+        if any(key not in used_columns for key in source.data):
+            source.data = {key: value for key, value in source.data.items() if key in used_columns}
+
+    def _prune_unused_columns(self):
+        used_columns = self._used_columns()
+        for source in [self.csd_source] + self.dataset_sources:
+            self._prune_source(source, used_columns)
+        logging.info(f'Writing {len(self.csd_source.data)} columns to the html, '
+                     f'{len(set(self.df.columns) - used_columns)} unused columns are left out.')
+
     def initialize_data(self):
         if self.add_id_to_dataframe and 'id' not in self.df.columns:
             self.df.insert(0, 'id', range(0, len(self.df)))
 
-        self.df['active_axis_x'] = self.df[self.x_axis_key]
-        self.df['active_axis_y'] = self.df[self.y_axis_key]
-
         if self.scatter_color_legend_key and self.scatter_marker_legend_key:
             self.df['legend'] = self.df.apply(
                 lambda x: f'{x[self.scatter_color_legend_key]} {x[self.scatter_marker_legend_key]}', axis=1
@@ -249,12 +464,15 @@ class BokehBioImageDataVis:
             self.df['color_mapping'] = [palette[unique_categories.tolist().index(category)] for category in
                                         self.df[self.category_key]]
 
-        self.csd_source = ColumnDataSource(data=self.df)
+        source_df = self.df
+        if self.compact_columns:
+            source_df = compact_numeric_columns(self.df, self.compact_columns_tolerance)
+        self.csd_source = ColumnDataSource(data=source_df)
         self.csd_view = _make_cds_view(self.csd_source)
 
     def initialize_highlighter(self, init_index=0):
-        self.highlight_df = pd.DataFrame({'highlight_x': [self.df['active_axis_x'].iloc[init_index]],
-                                          'highlight_y': [self.df['active_axis_y'].iloc[init_index]],
+        self.highlight_df = pd.DataFrame({'highlight_x': [self.df[self.x_axis_key].iloc[init_index]],
+                                          'highlight_y': [self.df[self.y_axis_key].iloc[init_index]],
                                           'last_selected_index': [0]})
 
         self.highlight_csd_source = ColumnDataSource(data=self.highlight_df)
@@ -291,7 +509,7 @@ class BokehBioImageDataVis:
     def _refresh_registered_video_divs(self):
         sync_count = self._video_sync_count()
         for registered_video_element in self.registered_video_elements:
-            video_div, _ = video_html_and_callback(
+            video_div = video_html(
                 unique_html_id=registered_video_element['id'],
                 df=self.df,
                 key=registered_video_element['key'],
@@ -300,6 +518,7 @@ class BokehBioImageDataVis:
                 title=registered_video_element['title'],
                 autoplay=registered_video_element['autoplay'],
                 sync_count=sync_count,
+                poster_key=registered_video_element.get('poster_key'),
             )
             registered_video_element['div'].text = video_div.text
 
@@ -317,23 +536,48 @@ class BokehBioImageDataVis:
             return path_value
         return join(self.output_folder, path_value)
 
-    def _ensure_missing_image_placeholder(self):
-        missing_data_icon = 'data_missing.png'
-        output_path_missing = join(self.output_folder, 'data', missing_data_icon)
+    def _media_path_exists(self, path_value):
+        resolved_path = self._resolve_media_path(path_value)
+        return bool(resolved_path) and self.directory_index.exists(resolved_path)
+
+    def _ensure_placeholder(self, resource_filename, output_filename):
+        if output_filename in self.ensured_placeholders:
+            return self.ensured_placeholders[output_filename]
+
+        resource_path = join(os.path.dirname(__file__), 'resources', resource_filename)
+        output_path_missing = join(self.output_folder, 'data', output_filename)
         if not os.path.exists(os.path.dirname(output_path_missing)):
             os.makedirs(os.path.dirname(output_path_missing))
-        if not os.path.exists(output_path_missing):
-            shutil.copyfile(join(os.path.dirname(__file__), 'resources', 'MissingDataIcon.png'), output_path_missing)
-        return join('data', missing_data_icon), output_path_missing
+
+        # with a manifest, a placeholder is also refreshed when the packaged resource changed
+        resource_signature = stat_signature(resource_path)
+        needs_copy = not os.path.exists(output_path_missing)
+        if self.export_manifest is not None and not needs_copy:
+            needs_copy = self.export_manifest.get('placeholder', resource_path, resource_signature,
+                                                  output=output_filename) is None
+        if needs_copy:
+            shutil.copyfile(resource_path, output_path_missing)
+            self.directory_index.add(output_path_missing)
+            if self.export_manifest is not None and resource_signature is not None:
+                self.export_manifest.set('placeholder', resource_path, resource_signature, output=output_filename)
+
+        self.ensured_placeholders[output_filename] = (join('data', output_filename), output_path_missing)
+        return self.ensured_placeholders[output_filename]
+
+    def _ensure_missing_image_placeholder(self):
+        return self._ensure_placeholder('MissingDataIcon.png', 'data_missing.png')
 
     def _ensure_missing_video_placeholder(self):
-        missing_data_mp4 = 'data_missing.mp4'
-        output_path_missing = join(self.output_folder, 'data', missing_data_mp4)
-        if not os.path.exists(os.path.dirname(output_path_missing)):
-            os.makedirs(os.path.dirname(output_path_missing))
-        if not os.path.exists(output_path_missing):
-            shutil.copyfile(join(os.path.dirname(__file__), 'resources', 'MissingDataVideo.mp4'), output_path_missing)
-        return join('data', missing_data_mp4), output_path_missing
+        return self._ensure_placeholder('MissingDataVideo.mp4', 'data_missing.mp4')
+
+    def _missing_media_mapping(self, key, missing_path_relative, media_type):
+        # existence is checked once per distinct path, not once per row
+        missing_media_mapping = {}
+        for path_value in self.df[key].unique():
+            if not path_value or not self._media_path_exists(path_value):
+                logging.warning(f'Path {path_value} does not exist. Replacing with data missing {media_type}.')
+                missing_media_mapping[path_value] = missing_path_relative
+        return missing_media_mapping
 
     def _prepare_image_column(self, key):
         if key not in self.df.columns:
@@ -347,14 +591,17 @@ class BokehBioImageDataVis:
                                                                 output_folder=self.output_folder,
                                                                 used_paths=self.used_paths,
                                                                 copy_files_dir_level=self.copy_files_dir_level,
-                                                                copied_paths_by_source=self.copied_paths_by_source)
+                                                                copied_paths_by_source=self.copied_paths_by_source,
+                                                                copy_workers=self.copy_files_workers,
+                                                                layout=self.copy_files_layout,
+                                                                link_mode=self.copy_files_link_mode,
+                                                                manifest=self.export_manifest,
+                                                                record_hashes=self.export_manifest_hashes,
+                                                                directory_index=self.directory_index)
             self.csd_source.data[key] = self.df[key]
 
         missing_path_relative, _ = self._ensure_missing_image_placeholder()
-        for path_img in self.df[key]:
-            if not path_img or not os.path.exists(self._resolve_media_path(path_img)):
-                logging.warning(f'Path {path_img} does not exist. Replacing with data missing image.')
-                self.df[key] = self.df[key].replace(path_img, missing_path_relative)
+        self.df = apply_path_mapping(self.df, key, self._missing_media_mapping(key, missing_path_relative, 'image'))
 
         self.csd_source.data[key] = self.df[key]
 
@@ -365,19 +612,26 @@ class BokehBioImageDataVis:
         self.df = sanitize_media_path_column(self.df, key)
         self.csd_source.data[key] = self.df[key]
 
+        # remuxed videos are written to the output folder directly, so the copy below skips them
+        if self.faststart_videos and key not in self.generated_media_keys:
+            self.df = apply_path_mapping(self.df, key, self._remux_faststart_videos(key))
+
         if self.do_copy_files_to_output_dir and key not in self.generated_media_keys:
             self.df, self.used_paths = copy_files_to_output_dir(df=self.df, path_key=key,
                                                                 output_folder=self.output_folder,
                                                                 used_paths=self.used_paths,
                                                                 copy_files_dir_level=self.copy_files_dir_level,
-                                                                copied_paths_by_source=self.copied_paths_by_source)
+                                                                copied_paths_by_source=self.copied_paths_by_source,
+                                                                copy_workers=self.copy_files_workers,
+                                                                layout=self.copy_files_layout,
+                                                                link_mode=self.copy_files_link_mode,
+                                                                manifest=self.export_manifest,
+                                                                record_hashes=self.export_manifest_hashes,
+                                                                directory_index=self.directory_index)
             self.csd_source.data[key] = self.df[key]
 
         missing_path_relative, _ = self._ensure_missing_video_placeholder()
-        for path_video in self.df[key]:
-            if not path_video or not os.path.exists(self._resolve_media_path(path_video)):
-                logging.warning(f'Path {path_video} does not exist. Replacing with data missing video.')
-                self.df[key] = self.df[key].replace(path_video, missing_path_relative)
+        self.df = apply_path_mapping(self.df, key, self._missing_media_mapping(key, missing_path_relative, 'video'))
 
         self.csd_source.data[key] = self.df[key]
 
@@ -390,10 +644,9 @@ class BokehBioImageDataVis:
 
         reference_video_abs = None
         for path_value in self.df[key]:
-            resolved_path = self._resolve_media_path(path_value)
-            if not resolved_path or not os.path.exists(resolved_path):
+            if not self._media_path_exists(path_value):
                 continue
-            normalized_path = os.path.abspath(resolved_path)
+            normalized_path = os.path.abspath(self._resolve_media_path(path_value))
             if normalized_path == missing_video_abs:
                 continue
             reference_video_abs = normalized_path
@@ -443,15 +696,43 @@ class BokehBioImageDataVis:
         except ffmpeg.Error as exc:
             raise RuntimeError(f'{description} failed.\n{self._format_ffmpeg_error(exc)}') from exc
 
+    def _original_source_path(self, video_path):
+        # media copied by this export are probed and transcoded by their original path, which stays the same across
+        # exports. Copies are only ever added, so only the ones added since the last lookup are mapped back; several
+        # sources can share one output (copy_files_layout='content'), so the map can be smaller than the copies.
+        if self.copied_sources_synced != len(self.copied_paths_by_source):
+            output_folder_abs = os.path.abspath(self.output_folder)
+            for source_path, target_path in islice(self.copied_paths_by_source.items(), self.copied_sources_synced,
+                                                   None):
+                self.copied_sources_by_output[os.path.normpath(join(output_folder_abs, target_path))] = source_path
+            self.copied_sources_synced = len(self.copied_paths_by_source)
+        return self.copied_sources_by_output.get(os.path.abspath(video_path), video_path)
+
     def _probe_video_info(self, video_path):
-        self._ensure_ffmpeg_tools_available()
+        # single entry point for video probes, results of unchanged videos are reused from the probe cache
+        cache_path = self._original_source_path(video_path)
+        video_signature = stat_signature(cache_path)
+        if video_signature is None:
+            cache_path = video_path
+            video_signature = stat_signature(video_path)
+        cached_info = self.probe_cache.get(cache_path, video_signature)
+        if cached_info is not None:
+            cached_info['fps'] = Fraction(cached_info['fps_text'])
+            return cached_info
+
+        video_info = self._run_video_probe(video_path)
+        self.probe_cache.set(cache_path, video_signature,
+                             {key: value for key, value in video_info.items() if key != 'fps'})
+        return video_info
+
+    def _ffprobe_video_stream(self, video_path, show_entries, **probe_kwargs):
         try:
             probe_data = ffmpeg.probe(
                 video_path,
                 cmd='ffprobe',
                 select_streams='v:0',
-                count_frames=None,
-                show_entries='stream=width,height,avg_frame_rate,nb_read_frames',
+                show_entries=show_entries,
+                **probe_kwargs,
             )
         except ffmpeg.Error as exc:
             raise RuntimeError(f'ffprobe for {video_path} failed.\n{self._format_ffmpeg_error(exc)}') from exc
@@ -459,30 +740,34 @@ class BokehBioImageDataVis:
         stream_info = (probe_data.get('streams') or [None])[0]
         if stream_info is None:
             raise RuntimeError(f'Could not find a video stream in {video_path}.')
+        return stream_info, probe_data.get('format') or {}
+
+    @staticmethod
+    def _parse_probe_count(value):
+        try:
+            count = int(str(value))
+        except ValueError:
+            return None
+        return count if count > 0 else None
+
+    def _run_video_probe(self, video_path):
+        self._ensure_ffmpeg_tools_available()
+
+        # tier 1: container metadata only, nothing is decoded
+        stream_info, format_info = self._ffprobe_video_stream(
+            video_path,
+            show_entries='stream=width,height,avg_frame_rate,nb_frames,duration:format=duration',
+        )
 
         frame_rate_text = str(stream_info.get('avg_frame_rate', ''))
         if frame_rate_text in ('', '0/0'):
             raise RuntimeError(f'Could not determine the average frame rate for {video_path}.')
 
-        frame_count_text = str(stream_info.get('nb_read_frames', ''))
-        if frame_count_text in ('', 'N/A'):
-            raise RuntimeError(
-                f'Could not determine the exact number of frames for {video_path}. '
-                'Stacked video hovers require an exact frame count.'
-            )
-
-        try:
-            frame_count = int(frame_count_text)
-        except ValueError as exc:
-            raise RuntimeError(f'Could not parse the frame count for {video_path}: {frame_count_text}') from exc
-
         try:
             fps = Fraction(frame_rate_text)
         except (ValueError, ZeroDivisionError) as exc:
             raise RuntimeError(f'Could not parse the frame rate for {video_path}: {frame_rate_text}') from exc
 
-        if frame_count <= 0:
-            raise RuntimeError(f'Video {video_path} does not contain any frames.')
         if fps <= 0:
             raise RuntimeError(f'Video {video_path} has an invalid frame rate: {frame_rate_text}.')
 
@@ -491,10 +776,54 @@ class BokehBioImageDataVis:
         if width is None or height is None:
             raise RuntimeError(f'Could not determine the frame size for {video_path}.')
 
+        metadata_frame_count = self._parse_probe_count(stream_info.get('nb_frames', ''))
+        duration_frame_count = None
+        for duration_text in (stream_info.get('duration'), format_info.get('duration')):
+            try:
+                duration_frame_count = round(Fraction(str(duration_text)) * fps)
+                break
+            except (ValueError, ZeroDivisionError):
+                continue
+
+        frame_count = None
+        frame_count_source = None
+        if metadata_frame_count is not None and metadata_frame_count == duration_frame_count:
+            frame_count = metadata_frame_count
+            frame_count_source = 'metadata'
+
+        # tier 2: count the packets, this reads the file but does not decode it
+        if frame_count is None:
+            stream_info, _ = self._ffprobe_video_stream(video_path, show_entries='stream=nb_read_packets',
+                                                        count_packets=None)
+            packet_count = self._parse_probe_count(stream_info.get('nb_read_packets', ''))
+            if packet_count is not None and packet_count in (metadata_frame_count, duration_frame_count):
+                frame_count = packet_count
+                frame_count_source = 'packets'
+
+        # tier 3: the estimates disagree or are missing, decode the whole video
+        if frame_count is None:
+            stream_info, _ = self._ffprobe_video_stream(video_path, show_entries='stream=nb_read_frames',
+                                                        count_frames=None)
+            frame_count_text = str(stream_info.get('nb_read_frames', ''))
+            if frame_count_text in ('', 'N/A'):
+                raise RuntimeError(
+                    f'Could not determine the exact number of frames for {video_path}. '
+                    'Stacked video hovers require an exact frame count.'
+                )
+            try:
+                frame_count = int(frame_count_text)
+            except ValueError as exc:
+                raise RuntimeError(f'Could not parse the frame count for {video_path}: {frame_count_text}') from exc
+            frame_count_source = 'decode'
+
+        if frame_count <= 0:
+            raise RuntimeError(f'Video {video_path} does not contain any frames.')
+
         return {
             'width': int(width),
             'height': int(height),
             'frame_count': frame_count,
+            'frame_count_source': frame_count_source,
             'fps': fps,
             'fps_text': frame_rate_text,
         }
@@ -512,11 +841,10 @@ class BokehBioImageDataVis:
         for source_key in spec['keys']:
             if source_key not in self.df.columns:
                 raise KeyError(f"Could not find stacked source key '{source_key}' in the dataframe.")
-            for path_value in self.df[source_key]:
-                resolved_path = self._resolve_media_path(path_value)
-                if not resolved_path or not os.path.exists(resolved_path):
+            for path_value in self.df[source_key].unique():
+                if not self._media_path_exists(path_value):
                     continue
-                normalized_path = os.path.abspath(resolved_path)
+                normalized_path = os.path.abspath(self._resolve_media_path(path_value))
                 if normalized_path == missing_video_abs or normalized_path in seen_candidate_paths:
                     continue
                 seen_candidate_paths.add(normalized_path)
@@ -547,34 +875,77 @@ class BokehBioImageDataVis:
                         + ', '.join(mismatch_messages)
                         + '.'
                     )
+            frame_count_sources = sorted({
+                sample_info.get('frame_count_source', 'decode') for sample_info in sample_infos
+            })
             print(
                 f"Stacked video fast path assumption for {cache_key}: sampled {len(sample_paths)} real videos, "
                 f"assuming shared size={reference_info['width']}x{reference_info['height']}, "
-                f"frames={reference_info['frame_count']}, fps={reference_info['fps_text']}; "
-                "skipping per-input ffprobe."
+                f"frames={reference_info['frame_count']} (from {'/'.join(frame_count_sources)}), "
+                f"fps={reference_info['fps_text']}; skipping per-input ffprobe."
             )
         else:
             reference_info = self._probe_video_info(missing_video_abs)
             print(
                 f"Stacked video fast path assumption for {cache_key}: found no real videos, using the missing-video "
                 f"placeholder as reference with size={reference_info['width']}x{reference_info['height']}, "
-                f"frames={reference_info['frame_count']}, fps={reference_info['fps_text']}; "
-                "skipping per-input ffprobe."
+                f"frames={reference_info['frame_count']} (from {reference_info.get('frame_count_source', 'decode')}), "
+                f"fps={reference_info['fps_text']}; skipping per-input ffprobe."
             )
 
         self.stacked_video_reference_info_cache[cache_key] = dict(reference_info)
         return dict(reference_info)
 
-    def _build_stacked_video_output(self, input_paths, spec):
+    def _resolve_video_input(self, input_path):
+        # a single stat covers the existence check and the cache signature of an encode input
+        resolved_input_path = self._resolve_media_path(input_path)
+        try:
+            input_stat = os.stat(resolved_input_path) if resolved_input_path else None
+        except OSError:
+            input_stat = None
+        if input_stat is None:
+            _, resolved_input_path = self._ensure_missing_video_placeholder()
+            input_stat = os.stat(resolved_input_path)
+        return os.path.abspath(resolved_input_path), input_stat
+
+    def _cached_output_paths(self, subfolder, prefix, cache_payload, extension='.mp4'):
+        output_dir = join(self.output_folder, 'data', subfolder)
+        os.makedirs(output_dir, exist_ok=True)
+
+        cache_hash = hashlib.sha256(
+            json.dumps(cache_payload, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:24]
+        output_filename = f'{prefix}_{cache_hash}{extension}'
+        return join(output_dir, output_filename), join('data', subfolder, output_filename)
+
+    def _run_ffmpeg_to_cached_output(self, input_stream, output_path_absolute, description, **output_stream_kwargs):
+        self._run_ffmpeg_atomically(
+            lambda partial_output_path: build_ffmpeg_output_stream(input_stream, output_path=partial_output_path,
+                                                                   **output_stream_kwargs),
+            output_path_absolute,
+            description,
+        )
+
+    def _run_ffmpeg_atomically(self, build_stream, output_path_absolute, description):
+        # write to a partial file first, an interrupted or failed run must never look like a cached output
+        output_dir, output_filename = os.path.split(output_path_absolute)
+        partial_output_path = join(output_dir, f'.partial_{output_filename}')
+        ffmpeg_stream = build_stream(partial_output_path)
+        try:
+            self._run_ffmpeg_stream(ffmpeg_stream, f'{description} for {output_filename}')
+            os.replace(partial_output_path, output_path_absolute)
+        finally:
+            if os.path.exists(partial_output_path):
+                os.remove(partial_output_path)
+        self.directory_index.add(output_path_absolute)
+
+    def _build_stacked_video_output(self, input_paths, spec, ffmpeg_threads=None):
         _, missing_video_abs = self._ensure_missing_video_placeholder()
         missing_video_abs = os.path.abspath(missing_video_abs)
 
-        resolved_input_paths = []
-        for input_path in input_paths:
-            resolved_input_path = self._resolve_media_path(input_path)
-            if not resolved_input_path or not os.path.exists(resolved_input_path):
-                resolved_input_path = missing_video_abs
-            resolved_input_paths.append(os.path.abspath(resolved_input_path))
+        resolved_inputs = [self._resolve_video_input(input_path) for input_path in input_paths]
+        resolved_input_paths = [resolved_input_path for resolved_input_path, _ in resolved_inputs]
+        input_stats = [input_stat for _, input_stat in resolved_inputs]
 
         reference_info = self._get_uniform_stacked_video_reference_info(spec)
         cell_width = reference_info['width']
@@ -599,25 +970,17 @@ class BokehBioImageDataVis:
             'inputs': [
                 {
                     'path': path,
-                    'size': os.path.getsize(path),
-                    'mtime': os.path.getmtime(path),
+                    'size': input_stat.st_size,
+                    'mtime': input_stat.st_mtime,
                 }
-                for path in resolved_input_paths
+                for path, input_stat in zip(resolved_input_paths, input_stats)
             ],
         }
 
-        merged_video_dir = join(self.output_folder, 'data', 'merged_videos')
-        if not os.path.exists(merged_video_dir):
-            os.makedirs(merged_video_dir)
+        output_path_absolute, output_path_relative = self._cached_output_paths('merged_videos', 'stacked',
+                                                                               cache_payload)
 
-        cache_hash = hashlib.sha256(
-            json.dumps(cache_payload, sort_keys=True, default=str).encode('utf-8')
-        ).hexdigest()[:24]
-        output_filename = f'stacked_{cache_hash}.mp4'
-        output_path_absolute = join(merged_video_dir, output_filename)
-        output_path_relative = join('data', 'merged_videos', output_filename)
-
-        if os.path.exists(output_path_absolute):
+        if self.directory_index.exists(output_path_absolute):
             return output_path_relative
 
         needs_placeholder_normalization = True
@@ -670,27 +1033,384 @@ class BokehBioImageDataVis:
         stacked_stream = ffmpeg.filter(prepared_streams, stack_operator, inputs=len(prepared_streams))
         stacked_stream = stacked_stream.filter('pad', 'ceil(iw/2)*2', 'ceil(ih/2)*2', color='white')
 
-        ffmpeg_stream = build_ffmpeg_output_stream(
+        # the thread count only affects speed, so it is not part of the cache payload above
+        extra_output_kwargs = {'an': None}
+        if ffmpeg_threads is not None:
+            extra_output_kwargs['threads'] = ffmpeg_threads
+
+        self._run_ffmpeg_to_cached_output(
             stacked_stream,
-            output_path=output_path_absolute,
+            output_path_absolute,
+            'ffmpeg stacked video export',
             encoding=spec['encoding'],
             ffmpeg_crf=spec['ffmpeg_crf'],
             ffmpeg_preset=spec['ffmpeg_preset'],
             ffmpeg_options=spec['ffmpeg_options'],
-            extra_output_kwargs={'an': None},
+            extra_output_kwargs=extra_output_kwargs,
+        )
+        return output_path_relative
+
+    def _build_web_video_output(self, input_path, spec, ffmpeg_threads=None):
+        resolved_input_path, input_stat = self._resolve_video_input(input_path)
+
+        # downscale to the display width only, never upscale; -2 keeps the aspect ratio with an even height
+        extra_output_kwargs = {'an': None, 'movflags': '+faststart'}
+        if spec['max_bitrate'] is not None:
+            extra_output_kwargs['maxrate'] = spec['max_bitrate']
+            extra_output_kwargs['bufsize'] = spec['max_bitrate']
+        output_kwargs = resolve_ffmpeg_output_kwargs(
+            spec['encoding'],
+            ffmpeg_crf=spec['ffmpeg_crf'],
+            ffmpeg_preset=spec['ffmpeg_preset'],
+            ffmpeg_options=spec['ffmpeg_options'],
+            extra_output_kwargs=extra_output_kwargs,
+        )
+
+        cache_payload = {
+            'encoding': spec['encoding'],
+            'width': spec['width'],
+            'output_kwargs': output_kwargs,
+            'inputs': [
+                {
+                    'path': resolved_input_path,
+                    'size': input_stat.st_size,
+                    'mtime': input_stat.st_mtime,
+                }
+            ],
+        }
+        output_path_absolute, output_path_relative = self._cached_output_paths('web_videos', 'web', cache_payload)
+        if self.directory_index.exists(output_path_absolute):
+            return output_path_relative
+
+        stream = ffmpeg.input(resolved_input_path).video
+        if spec['width']:
+            stream = stream.filter('scale', f"trunc(min(iw,{int(spec['width'])})/2)*2", -2)
+        stream = stream.filter('setsar', '1')
+
+        if ffmpeg_threads is not None:
+            extra_output_kwargs['threads'] = ffmpeg_threads
+        self._run_ffmpeg_to_cached_output(
+            stream,
+            output_path_absolute,
+            'ffmpeg web video export',
+            encoding=spec['encoding'],
+            ffmpeg_crf=spec['ffmpeg_crf'],
+            ffmpeg_preset=spec['ffmpeg_preset'],
+            ffmpeg_options=spec['ffmpeg_options'],
+            extra_output_kwargs=extra_output_kwargs,
         )
-        self._run_ffmpeg_stream(ffmpeg_stream, f'ffmpeg stacked video export for {output_filename}')
         return output_path_relative
 
+    def _build_faststart_output(self, source_path, ffmpeg_threads=None):
+        # stream copy only, no re-encode: moves the moov atom in front of the media data
+        source_stat = os.stat(source_path)
+        cache_payload = {'path': source_path, 'size': source_stat.st_size, 'mtime': source_stat.st_mtime}
+        _, extension = os.path.splitext(source_path)
+        output_path_absolute, output_path_relative = self._cached_output_paths('faststart_videos', 'faststart',
+                                                                               cache_payload, extension=extension)
+        if self.directory_index.exists(output_path_absolute):
+            return output_path_relative
+
+        self._run_ffmpeg_atomically(
+            lambda partial_output_path: ffmpeg.input(source_path).output(
+                partial_output_path, c='copy', movflags='+faststart'),
+            output_path_absolute,
+            'ffmpeg faststart remux',
+        )
+        return output_path_relative
+
+    def _remux_faststart_videos(self, key):
+        # before copying, the paths still point to the sources; afterwards they are relative to the output folder
+        copies_pending = self.do_copy_files_to_output_dir
+        _, missing_video_abs = self._ensure_missing_video_placeholder()
+        missing_video_abs = os.path.abspath(missing_video_abs)
+        path_mapping = {}
+        source_paths_by_path = {}
+        for path_value in self.df[key].unique():
+            if not path_value:
+                continue
+            source_path = os.path.abspath(path_value if copies_pending else self._resolve_media_path(path_value))
+            if source_path == missing_video_abs:
+                continue
+            if source_path in self.faststart_output_cache:
+                # None marks videos that are fine as they are
+                if self.faststart_output_cache[source_path] is not None:
+                    path_mapping[path_value] = self.faststart_output_cache[source_path]
+            elif moov_after_mdat(source_path):
+                source_paths_by_path[path_value] = source_path
+            else:
+                self.faststart_output_cache[source_path] = None
+
+        if source_paths_by_path:
+            self._ensure_ffmpeg_tools_available()
+        self._run_encode_jobs(
+            key,
+            'faststart remuxes',
+            self._build_faststart_output,
+            list(dict.fromkeys(source_paths_by_path.values())),
+            self.faststart_output_cache,
+        )
+        for path_value, source_path in source_paths_by_path.items():
+            path_mapping[path_value] = self.faststart_output_cache[source_path]
+        return path_mapping
+
+    def _is_web_video_source_only(self, key):
+        # columns that are only read to transcode web videos are not copied, the page never loads the originals
+        if key in self.generated_media_keys or not any(spec['source_key'] == key for spec in self.web_video_specs.values()):
+            return False
+        for registered_element in self.registered_image_elements + self.registered_video_elements:
+            if key in (registered_element.get('key'), registered_element.get('link_key'),
+                       registered_element.get('poster_key')):
+                return False
+        if any(key in spec['keys'] for spec in self.stacked_video_specs.values()):
+            return False
+        for specs, source_field in ((self.video_poster_specs, 'video_key'), (self.image_thumbnail_specs, 'image_key'),
+                                    (self.tiff_display_specs, 'image_key')):
+            if any(spec[source_field] == key for spec in specs.values()):
+                return False
+        return True
+
+    def _materialize_web_video_column(self, key, prepared_media_keys=None):
+        spec = self.web_video_specs[key]
+        # a column that is only transcoded is read where it is, otherwise it is prepared (copied) like any video
+        source_only = self._is_web_video_source_only(spec['source_key'])
+        if not source_only:
+            self._prepare_media_key_for_dataset(spec['source_key'], prepared_media_keys=prepared_media_keys,
+                                                prefer_video=True)
+
+        web_video_cache = self.web_video_output_cache.setdefault(key, {})
+        input_paths = self.df[spec['source_key']].map(sanitize_media_path_value).tolist()
+        pending_input_paths = [
+            input_path for input_path in dict.fromkeys(input_paths) if input_path not in web_video_cache
+        ]
+        # transcode from the originals, also when the column was copied for another element; uncopied sources are
+        # relative to the working directory, not to the output folder
+        sources_in_place = source_only and self.do_copy_files_to_output_dir
+        self._run_encode_jobs(
+            key,
+            'web videos',
+            lambda input_path, ffmpeg_threads: self._build_web_video_output(
+                self._original_source_path(os.path.abspath(
+                    input_path if sources_in_place else self._resolve_media_path(input_path))) if input_path else '',
+                spec, ffmpeg_threads=ffmpeg_threads),
+            pending_input_paths,
+            web_video_cache,
+        )
+
+        self.df[key] = [web_video_cache[input_path] for input_path in input_paths]
+        self.csd_source.data[key] = self.df[key]
+
+        if prepared_media_keys is not None:
+            prepared_media_keys.add(key)
+
+    def _build_video_poster_output(self, video_path, spec, ffmpeg_threads=None):
+        resolved_video_path, video_stat = self._resolve_video_input(video_path)
+
+        if spec['format'] == 'webp':
+            output_kwargs = {'vcodec': 'libwebp', 'quality': 80}
+        else:
+            output_kwargs = {'q:v': 3}
+        output_kwargs['frames:v'] = 1
+
+        cache_payload = {
+            'width': spec['width'],
+            'format': spec['format'],
+            'output_kwargs': output_kwargs,
+            'inputs': [
+                {
+                    'path': resolved_video_path,
+                    'size': video_stat.st_size,
+                    'mtime': video_stat.st_mtime,
+                }
+            ],
+        }
+        output_path_absolute, output_path_relative = self._cached_output_paths(
+            'video_posters', 'poster', cache_payload, extension=f".{spec['format']}")
+        if self.directory_index.exists(output_path_absolute):
+            return output_path_relative
+
+        stream = ffmpeg.input(resolved_video_path).video
+        if spec['width']:
+            stream = stream.filter('scale', f"min(iw,{int(spec['width'])})", -2)
+        if ffmpeg_threads is not None:
+            output_kwargs['threads'] = ffmpeg_threads
+        self._run_ffmpeg_atomically(
+            lambda partial_output_path: stream.output(partial_output_path, **output_kwargs),
+            output_path_absolute,
+            'ffmpeg video poster export',
+        )
+        return output_path_relative
+
+    def _materialize_video_poster_column(self, key, prepared_media_keys=None):
+        spec = self.video_poster_specs[key]
+        self._prepare_media_key_for_dataset(spec['video_key'], prepared_media_keys=prepared_media_keys,
+                                            prefer_video=True)
+
+        video_poster_cache = self.video_poster_output_cache.setdefault(key, {})
+        video_paths = self.df[spec['video_key']].map(sanitize_media_path_value).tolist()
+        pending_video_paths = [
+            video_path for video_path in dict.fromkeys(video_paths) if video_path not in video_poster_cache
+        ]
+        self._run_encode_jobs(
+            key,
+            'video posters',
+            lambda video_path, ffmpeg_threads: self._build_video_poster_output(
+                video_path, spec, ffmpeg_threads=ffmpeg_threads),
+            pending_video_paths,
+            video_poster_cache,
+        )
+
+        self.df[key] = [video_poster_cache[video_path] for video_path in video_paths]
+        self.csd_source.data[key] = self.df[key]
+
+        if prepared_media_keys is not None:
+            prepared_media_keys.add(key)
+
+    def _add_video_poster_key(self, video_key, width, poster_format):
+        if poster_format not in VIDEO_POSTER_FORMATS:
+            raise ValueError(f"poster_format must be in {VIDEO_POSTER_FORMATS}, got {poster_format}.")
+        self._ensure_ffmpeg_tools_available()
+
+        poster_key = f'_video_poster_{uuid.uuid4().hex}'
+        self.generated_media_keys.add(poster_key)
+        self.video_poster_specs[poster_key] = {
+            'key': poster_key,
+            'video_key': video_key,
+            'width': width,
+            'format': poster_format,
+        }
+        self._remember_media_key(poster_key)
+        self._materialize_video_poster_column(poster_key)
+        return poster_key
+
+    def _materialize_tiff_display_column(self, key, prepared_media_keys=None):
+        spec = self.tiff_display_specs[key]
+        self._prepare_media_key_for_dataset(spec['image_key'], prepared_media_keys=prepared_media_keys)
+
+        tiff_display_cache = self.tiff_display_output_cache.setdefault(key, {})
+        image_paths = self.df[spec['image_key']].map(sanitize_media_path_value).tolist()
+        settings = {setting: spec[setting]
+                    for setting in ('channel_colors', 'contrast_limits', 'contrast_percentiles', 'z_projection')}
+
+        jobs = {}
+        for image_path in dict.fromkeys(image_paths):
+            if image_path in tiff_display_cache:
+                continue
+            source_path = os.path.abspath(self._resolve_media_path(image_path))
+            source_signature = stat_signature(source_path) if is_tiff_path(image_path) else None
+            if source_signature is None:
+                # other images (and the missing image placeholder) are shown as they are
+                tiff_display_cache[image_path] = image_path
+                continue
+            cache_payload = {'path': source_path, 'signature': source_signature, 'settings': settings}
+            output_path_absolute, output_path_relative = self._cached_output_paths(
+                'tiff_display', 'display', cache_payload, extension='.png')
+            if output_path_absolute not in jobs and not self.directory_index.exists(output_path_absolute):
+                jobs[output_path_absolute] = (source_path, output_path_absolute, settings)
+            tiff_display_cache[image_path] = output_path_relative
+
+        run_in_pool(convert_tiff_for_display, list(jobs.values()), workers=self.image_derivative_workers,
+                    use_processes=self.image_derivative_processes, description='tiff display images')
+        for output_path_absolute in jobs:
+            self.directory_index.add(output_path_absolute)
+
+        self.df[key] = [tiff_display_cache[image_path] for image_path in image_paths]
+        self.csd_source.data[key] = self.df[key]
+
+        if prepared_media_keys is not None:
+            prepared_media_keys.add(key)
+
+    def _image_content_hashes(self, source_paths):
+        # with a manifest, unchanged sources are not read again just to learn their hash
+        signatures = {source_path: stat_signature(source_path) for source_path in source_paths}
+        content_hashes = {}
+        pending_source_paths = []
+        for source_path, signature in signatures.items():
+            entry = None
+            if self.export_manifest is not None:
+                entry = self.export_manifest.get('image_hash', source_path, signature)
+            if entry is not None:
+                content_hashes[source_path] = entry['hash']
+            else:
+                pending_source_paths.append(source_path)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.copy_files_workers, len(pending_source_paths) or 1))) \
+                as executor:
+            for source_path, content_hash in zip(pending_source_paths,
+                                                 executor.map(hash_file, pending_source_paths)):
+                content_hashes[source_path] = content_hash
+                if self.export_manifest is not None:
+                    self.export_manifest.set('image_hash', source_path, signatures[source_path], hash=content_hash)
+        return content_hashes
+
+    def _materialize_image_thumbnail_column(self, key, prepared_media_keys=None):
+        spec = self.image_thumbnail_specs[key]
+        self._prepare_media_key_for_dataset(spec['image_key'], prepared_media_keys=prepared_media_keys)
+
+        image_thumbnail_cache = self.image_thumbnail_output_cache.setdefault(key, {})
+        image_paths = self.df[spec['image_key']].map(sanitize_media_path_value).tolist()
+        _, missing_image_abs = self._ensure_missing_image_placeholder()
+        missing_image_abs = os.path.abspath(missing_image_abs)
+
+        source_paths_by_path = {}
+        for image_path in dict.fromkeys(image_paths):
+            if image_path in image_thumbnail_cache:
+                continue
+            source_path = os.path.abspath(self._resolve_media_path(image_path))
+            if not image_path or source_path == missing_image_abs:
+                image_thumbnail_cache[image_path] = image_path
+            else:
+                source_paths_by_path[image_path] = source_path
+
+        # outputs are named by the content hash of the source and the derivative settings, so identical images are
+        # only processed once and unchanged images are never processed again
+        settings_hash = hashlib.sha256(json.dumps(
+            {setting: spec[setting] for setting in ('max_width', 'max_height', 'format', 'quality')},
+            sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        output_dir = join(self.output_folder, 'data', 'image_thumbnails')
+        os.makedirs(output_dir, exist_ok=True)
+        content_hashes = self._image_content_hashes(list(dict.fromkeys(source_paths_by_path.values())))
+        jobs = {}
+        for image_path, source_path in source_paths_by_path.items():
+            output_filename = f"{content_hashes[source_path]}_{settings_hash}{derivative_extension(spec['format'])}"
+            output_path_absolute = join(output_dir, output_filename)
+            if output_path_absolute not in jobs and not self.directory_index.exists(output_path_absolute):
+                jobs[output_path_absolute] = (source_path, output_path_absolute, spec['max_width'],
+                                              spec['max_height'], spec['format'], spec['quality'])
+            image_thumbnail_cache[image_path] = join('data', 'image_thumbnails', output_filename)
+
+        build_image_derivatives(list(jobs.values()), workers=self.image_derivative_workers,
+                                use_processes=self.image_derivative_processes)
+        for output_path_absolute in jobs:
+            self.directory_index.add(output_path_absolute)
+
+        self.df[key] = [image_thumbnail_cache[image_path] for image_path in image_paths]
+        self.csd_source.data[key] = self.df[key]
+
+        if prepared_media_keys is not None:
+            prepared_media_keys.add(key)
+
     def _prepare_media_key_for_dataset(self, key, prepared_media_keys=None, prefer_video=False):
         if prepared_media_keys is not None and key in prepared_media_keys:
             return
+        if self._is_web_video_source_only(key):
+            return
 
         if key in self.stacked_video_specs:
             self._materialize_stacked_video_column(key, prepared_media_keys=prepared_media_keys)
+        elif key in self.web_video_specs:
+            self._materialize_web_video_column(key, prepared_media_keys=prepared_media_keys)
+        elif key in self.video_poster_specs:
+            self._materialize_video_poster_column(key, prepared_media_keys=prepared_media_keys)
         elif prefer_video:
             self._prepare_video_column(key)
-        elif any(element['key'] == key for element in self.registered_image_elements):
+        elif key in self.image_thumbnail_specs:
+            self._materialize_image_thumbnail_column(key, prepared_media_keys=prepared_media_keys)
+        elif key in self.tiff_display_specs:
+            self._materialize_tiff_display_column(key, prepared_media_keys=prepared_media_keys)
+        elif any(element['key'] == key for element in self.registered_image_elements) or \
+                any(spec['image_key'] == key for spec in self.image_thumbnail_specs.values()) or \
+                any(spec['image_key'] == key for spec in self.tiff_display_specs.values()):
             self._prepare_image_column(key)
         else:
             self._prepare_video_column(key)
@@ -698,6 +1418,62 @@ class BokehBioImageDataVis:
         if prepared_media_keys is not None:
             prepared_media_keys.add(key)
 
+    def _run_encode_jobs(self, key, description, build_output, pending_inputs, output_cache):
+        if not pending_inputs:
+            return
+
+        workers = min(self.video_encode_workers, len(pending_inputs))
+        ffmpeg_threads = self.ffmpeg_threads
+        if workers > 1:
+            # split the cpu budget between the concurrent encodes instead of letting each ffmpeg use all cores
+            ffmpeg_threads = max(1, (ffmpeg_threads or os.cpu_count() or 1) // workers)
+
+        # everything shared between the encodes has to be prepared before they run concurrently
+        self._ensure_missing_video_placeholder()
+
+        def encode(encode_input):
+            try:
+                return build_output(encode_input, ffmpeg_threads), None
+            except Exception as exc:
+                return None, exc
+
+        start_time = time.perf_counter()
+        if workers == 1:
+            results = [encode(encode_input) for encode_input in pending_inputs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(encode, pending_inputs))
+
+        # keep every finished output, even if some of the encodes failed
+        failures = []
+        for encode_input, (output_path, exc) in zip(pending_inputs, results):
+            if exc is None:
+                output_cache[encode_input] = output_path
+            else:
+                failures.append((encode_input, exc))
+
+        logging.info(f'Prepared {len(pending_inputs) - len(failures)}/{len(pending_inputs)} {description} '
+                     f'for {key} in {time.perf_counter() - start_time:.1f}s using {workers} worker(s).')
+        if failures:
+            failed_input, first_exc = failures[0]
+            raise RuntimeError(
+                f'{len(failures)} of {len(pending_inputs)} {description} encodes for {key} failed, '
+                f'the finished ones are cached and reused on the next run. '
+                f'First failure for input {failed_input}:\n{first_exc}'
+            ) from first_exc
+
+    def _encode_stacked_videos(self, key, spec, pending_input_paths, stacked_video_cache):
+        if pending_input_paths:
+            self._get_uniform_stacked_video_reference_info(spec)
+        self._run_encode_jobs(
+            key,
+            'stacked videos',
+            lambda row_input_paths, ffmpeg_threads: self._build_stacked_video_output(
+                row_input_paths, spec, ffmpeg_threads=ffmpeg_threads),
+            pending_input_paths,
+            stacked_video_cache,
+        )
+
     def _materialize_stacked_video_column(self, key, prepared_media_keys=None):
         spec = self.stacked_video_specs[key]
         for source_key in spec['keys']:
@@ -707,17 +1483,16 @@ class BokehBioImageDataVis:
                 prefer_video=True,
             )
 
-        stacked_video_paths = []
         stacked_video_cache = self.stacked_video_output_cache.setdefault(key, {})
-        for row_index in range(len(self.df)):
-            row_input_paths = tuple(
-                sanitize_media_path_value(self.df[source_key].iloc[row_index])
-                for source_key in spec['keys']
-            )
-            if row_input_paths not in stacked_video_cache:
-                stacked_video_cache[row_input_paths] = self._build_stacked_video_output(row_input_paths, spec)
-            stacked_video_paths.append(stacked_video_cache[row_input_paths])
+        source_columns = [self.df[source_key].map(sanitize_media_path_value).tolist() for source_key in spec['keys']]
+        row_input_paths_list = list(zip(*source_columns))
+        pending_input_paths = [
+            row_input_paths for row_input_paths in dict.fromkeys(row_input_paths_list)
+            if row_input_paths not in stacked_video_cache
+        ]
+        self._encode_stacked_videos(key, spec, pending_input_paths, stacked_video_cache)
 
+        stacked_video_paths = [stacked_video_cache[row_input_paths] for row_input_paths in row_input_paths_list]
         self.df[key] = stacked_video_paths
         self.csd_source.data[key] = self.df[key]
 
@@ -726,10 +1501,12 @@ class BokehBioImageDataVis:
 
     def create_scatter_figure(self, colorKey=None, markerKey=None, colorLegendKey=None, markerLegendKey=None, scatter_alpha=0.5, highlight_alpha=0.3):
         self.scatter_marker_key = markerKey or 'circle'
+        self.scatter_color_key = colorKey
         self.scatter_color_legend_key = colorLegendKey
         self.scatter_marker_legend_key = markerLegendKey
         self.initialize_data()
 
+        self.hover_tool = None
         self.scatter_figure = figure(height=self.scatter_height,
                                     width=self.scatter_width,
                                      x_axis_label=self.x_axis_key,
@@ -741,24 +1518,30 @@ class BokehBioImageDataVis:
                                    size=3 * self.scatter_size, color="red", alpha=highlight_alpha
                                    )
 
+        # explicit selection, nonselection and muted glyphs (with the look of bokeh's "auto" ones): BokehJS copies
+        # "auto" glyphs from the main glyph once, they would keep the initial columns when the axes are switched
+        secondary_glyph_kwargs = dict(selection_alpha=scatter_alpha,
+                                      nonselection_fill_alpha=0.2, nonselection_line_alpha=scatter_alpha,
+                                      muted_fill_alpha=0.2, muted_line_alpha=scatter_alpha)
+
         if colorKey:
             logging.info(f'Using {colorKey} as color key and {colorLegendKey} for legend.')
-            self.main_scatter_renderer = self.scatter_figure.scatter('active_axis_x', 'active_axis_y',
+            self.main_scatter_renderer = self.scatter_figure.scatter(self.x_axis_key, self.y_axis_key,
                                                                      source=self.csd_source, view=self.csd_view,
                                                                      size=self.scatter_size,
                                                                      alpha=scatter_alpha,
                                                                      marker=self.scatter_marker_key,
                                                                      color=colorKey, legend_group="legend",
-                                                                     name='main_graph')
+                                                                     name='main_graph', **secondary_glyph_kwargs)
         elif self.category_key:
             logging.info(f'Using {self.category_key} as color key.')
-            self.main_scatter_renderer = self.scatter_figure.scatter('active_axis_x', 'active_axis_y',
+            self.main_scatter_renderer = self.scatter_figure.scatter(self.x_axis_key, self.y_axis_key,
                                                                      source=self.csd_source, view=self.csd_view,
                                                                      size=self.scatter_size,
                                                                      alpha=scatter_alpha,
                                                                      marker=self.scatter_marker_key,
                                                                      color='color_mapping', legend_group="legend",
-                                                                     name='main_graph')
+                                                                     name='main_graph', **secondary_glyph_kwargs)
         else:
             scatter_kwargs = dict(
                 source=self.csd_source,
@@ -767,10 +1550,11 @@ class BokehBioImageDataVis:
                 name='main_graph',
                 alpha=scatter_alpha,
                 marker=self.scatter_marker_key,
+                **secondary_glyph_kwargs,
             )
             if self.scatter_marker_legend_key:
                 scatter_kwargs['legend_group'] = "legend"
-            self.main_scatter_renderer = self.scatter_figure.scatter('active_axis_x', 'active_axis_y', **scatter_kwargs)
+            self.main_scatter_renderer = self.scatter_figure.scatter(self.x_axis_key, self.y_axis_key, **scatter_kwargs)
 
         if self.scatter_figure.legend:
             if self.legend_position.lower() == "outside":
@@ -796,13 +1580,26 @@ class BokehBioImageDataVis:
                                        CustomJS(args=dict(source=self.csd_source,
                                                           highlight_df=self.highlight_csd_source,
                                                           axesselect_x=self.axesselect_x,
-                                                          xaxis=self.scatter_figure.xaxis[0]),
-                                                code="""
-          source.data['active_axis_x'] = source.data[axesselect_x.value];
-          source.change.emit();
+                                                          renderer=self.main_scatter_renderer,
+                                                          xaxis=self.scatter_figure.xaxis[0],
+                                                          bbdv_helpers=self.bbdv_helpers),
+                                                code=BBDV_DOM_HELPER_JS + """
+          // the glyphs are bound to the selected column, the data itself does not change. Every glyph is rebound,
+          // bokeh only shares the coordinates of the main glyph with glyphs bound to the same column. The decimated
+          // glyph (drawn while panning more than lod_threshold points) only exists in the renderer view.
+          const glyphs = [renderer.glyph, renderer.selection_glyph, renderer.nonselection_glyph,
+                          renderer.hover_glyph, renderer.muted_glyph];
+          const renderer_view = bbdv_get_view(renderer);
+          if (renderer_view != null && renderer_view.decimated_glyph != null) {
+              glyphs.push(renderer_view.decimated_glyph.model);
+          }
+          for (const glyph of glyphs) {
+              if (glyph != null && typeof glyph === "object") {
+                  glyph.x = {field: axesselect_x.value};
+              }
+          }
           const last_index = highlight_df.data["last_selected_index"][0];
           highlight_df.data["highlight_x"][0] =  source.data[axesselect_x.value][last_index];
-          console.log(last_index);
           highlight_df.change.emit();
           xaxis.axis_label = axesselect_x.value;
           """))
@@ -812,10 +1609,24 @@ class BokehBioImageDataVis:
                                        CustomJS(args=dict(source=self.csd_source,
                                                           highlight_df=self.highlight_csd_source,
                                                           axesselect_y=self.axesselect_y,
-                                                          yaxis=self.scatter_figure.yaxis[0]),
-                                                code="""
-          source.data['active_axis_y'] = source.data[axesselect_y.value];
-          source.change.emit();
+                                                          renderer=self.main_scatter_renderer,
+                                                          yaxis=self.scatter_figure.yaxis[0],
+                                                          bbdv_helpers=self.bbdv_helpers),
+                                                code=BBDV_DOM_HELPER_JS + """
+          // the glyphs are bound to the selected column, the data itself does not change. Every glyph is rebound,
+          // bokeh only shares the coordinates of the main glyph with glyphs bound to the same column. The decimated
+          // glyph (drawn while panning more than lod_threshold points) only exists in the renderer view.
+          const glyphs = [renderer.glyph, renderer.selection_glyph, renderer.nonselection_glyph,
+                          renderer.hover_glyph, renderer.muted_glyph];
+          const renderer_view = bbdv_get_view(renderer);
+          if (renderer_view != null && renderer_view.decimated_glyph != null) {
+              glyphs.push(renderer_view.decimated_glyph.model);
+          }
+          for (const glyph of glyphs) {
+              if (glyph != null && typeof glyph === "object") {
+                  glyph.y = {field: axesselect_y.value};
+              }
+          }
           const last_index = highlight_df.data["last_selected_index"][0];
           highlight_df.data["highlight_y"][0] =  source.data[axesselect_y.value][last_index];
           highlight_df.change.emit();
@@ -828,40 +1639,66 @@ class BokehBioImageDataVis:
 
         return row([self.scatterplot_select_options, Div(text="", width=4), self.scatter_figure])
 
-    def add_hover_highlight(self):
-        self._require_scatter_figure()
-
-        # TODO: probably can remove last_selected index in uuids and in all the other hovers and just use this one here?
-        code_hover_highlight = ("const indices = cb_data.index.indices;\n"
-                                "if(indices.length > 0){\n"
-                                "    const index = indices[0];\n"
-                                '    highlight_df.data["highlight_x"][0] = source.data["active_axis_x"][index];\n'
-                                '    highlight_df.data["highlight_y"][0] = source.data["active_axis_y"][index];\n'
-                                "    highlight_df.data['last_selected_index'][0] = index;\n"
-                                '    highlight_df.change.emit();\n')
+    def _build_row_refresh_js(self):
+        # shows row `index` in all registered media and text elements and moves the highlight there. The data of the
+        # source is never changed, so only the highlight source emits a change.
+        row_refresh_js = ""
+        for registered_element in (
+            self.registered_video_elements + self.registered_image_elements + self.registered_text_elements
+        ):
+            row_refresh_js += self._scope_js_update(registered_element['js_update'])
 
-        # check if self.manual_id_selection_slider exists
-        if hasattr(self, 'manual_id_selection_slider'):
-            code_hover_highlight += "    manual_id_selection.value = index;\n"
+        row_refresh_js += 'highlight_df.data["highlight_x"][0] = source.data[axesselect_x.value][index];\n'
+        row_refresh_js += 'highlight_df.data["highlight_y"][0] = source.data[axesselect_y.value][index];\n'
+        row_refresh_js += 'highlight_df.data["last_selected_index"][0] = index;\n'
+        row_refresh_js += 'highlight_df.change.emit();\n'
+        # Trigger video re-synchronisation after all sources have been updated
+        row_refresh_js += "if (window._vSync) { window._vSync = {r: new Set(), ok: false}; }\n"
+        return row_refresh_js
 
-        code_hover_highlight += "}"
+    def _refresh_hover_tool(self):
+        # all hover elements share one HoverTool: hit testing runs once per mouse move and the toolbar only shows
+        # a single hover icon. Its callback is rebuilt whenever an element is added.
+        self._require_scatter_figure()
 
+        hover_args = dict(source=self.csd_source, highlight_df=self.highlight_csd_source,
+                          axesselect_x=self.axesselect_x, axesselect_y=self.axesselect_y,
+                          bbdv_helpers=self.bbdv_helpers)
+        hover_args.update(self._registered_div_args())
+
+        row_refresh_js = self._build_row_refresh_js()
+        # whole videos are only fetched ahead for the slider neighbours, see add_video_hover
+        image_keys = [element['key'] for element in self.registered_image_elements]
+        if image_keys:
+            row_refresh_js += media_prefetch_js(image_keys=image_keys,
+                                                rows_expression=f'indices.slice(1, {1 + PREFETCH_ROWS})', indent='')
         if hasattr(self, 'manual_id_selection_slider'):
-            img_js_callback = CustomJS(
-                args=dict(source=self.csd_source, manual_id_selection=self.manual_id_selection_slider,
-                          highlight_df=self.highlight_csd_source),
-                code=code_hover_highlight)
+            # moved after the refresh, so the slider callback sees the row as shown and does not refresh it again
+            row_refresh_js += "manual_id_selection.value = index;\n"
+            hover_args['manual_id_selection'] = self.manual_id_selection_slider
+
+        code_hover = (BBDV_DOM_HELPER_JS +
+                      "const indices = cb_data.index.indices;\n"
+                      "if (indices.length == 0) { return; }\n"
+                      "const index = indices[0];\n"
+                      "// moving the mouse over the same point calls this again and again, only a new point needs work\n"
+                      'if (highlight_df.data["last_selected_index"][0] === index) { return; }\n' +
+                      scheduled_row_refresh_js(row_refresh_js))
+
+        if self.hover_tool is None:
+            self.hover_tool = self._make_hover_tool(CustomJS(args=hover_args, code=code_hover))
+            self.scatter_figure.add_tools(self.hover_tool)
         else:
-            img_js_callback = CustomJS(
-                args=dict(source=self.csd_source, highlight_df=self.highlight_csd_source),
-                code=code_hover_highlight)
+            self.hover_tool.callback.args = hover_args
+            self.hover_tool.callback.code = code_hover
 
-        img_hover_tool = self._make_hover_tool(img_js_callback)
-
-        self.scatter_figure.add_tools(img_hover_tool)
+    def add_hover_highlight(self):
+        self._refresh_hover_tool()
 
     def add_image_hover(self, key, height=300, width=300, image_width=None, image_height=None, legend_text="",
-                        title=None):
+                        title=None, thumbnail=False, thumbnail_scale=2, thumbnail_format='webp', thumbnail_quality=85,
+                        channel_colors=None, contrast_limits=None, contrast_percentiles=(0.1, 99.9),
+                        z_projection='max'):
         if self.dataset_selector is not None:
             raise RuntimeError("Please add the dataset selector after adding image hovers.")
         self._require_scatter_figure()
@@ -873,24 +1710,76 @@ class BokehBioImageDataVis:
             height = image_height
             logging.warning("image_height is deprecated and not used anymore. Use height instead")
 
+        if key not in self.df.columns:
+            raise KeyError(f"Could not find image key '{key}' in the dataframe.")
         self._remember_media_key(key)
-        self._prepare_image_column(key)
+        source_key = key
+
+        # tiff images can not be shown by browsers, they are rendered into pngs (colored channels, projected z)
+        # which link to the original tiff
+        link_key = None
+        if any(is_tiff_path(path) for path in self.df[key].map(sanitize_media_path_value).unique()):
+            if z_projection not in Z_PROJECTIONS:
+                raise ValueError(f"z_projection must be in {Z_PROJECTIONS}, got {z_projection}.")
+            if channel_colors is not None:
+                channel_colors = [parse_channel_color(color) for color in channel_colors]
+            require_tifffile()
+            require_pillow()
+            tiff_display_key = f'_tiff_display_{uuid.uuid4().hex}'
+            self.generated_media_keys.add(tiff_display_key)
+            self.tiff_display_specs[tiff_display_key] = {
+                'key': tiff_display_key,
+                'image_key': key,
+                'channel_colors': channel_colors,
+                'contrast_limits': normalize_contrast_limits(contrast_limits),
+                'contrast_percentiles': list(contrast_percentiles),
+                'z_projection': z_projection,
+            }
+            self._remember_media_key(tiff_display_key)
+            self._materialize_tiff_display_column(tiff_display_key)
+            link_key = source_key
+            key = tiff_display_key
+
+        # thumbnail: show a downscaled copy (thumbnail_scale times the element size, for HiDPI screens) that links
+        # to the original, instead of letting the browser decode the full image on every hover
+        if thumbnail:
+            if thumbnail_format not in IMAGE_DERIVATIVE_FORMATS:
+                raise ValueError(f"thumbnail_format must be in {IMAGE_DERIVATIVE_FORMATS}, got {thumbnail_format}.")
+            require_pillow()
+            thumbnail_key = f'_image_thumbnail_{uuid.uuid4().hex}'
+            self.generated_media_keys.add(thumbnail_key)
+            self.image_thumbnail_specs[thumbnail_key] = {
+                'key': thumbnail_key,
+                'image_key': key,
+                'max_width': None if width is None else int(round(width * thumbnail_scale)),
+                'max_height': None if height is None else int(round(height * thumbnail_scale)),
+                'format': thumbnail_format,
+                'quality': int(thumbnail_quality),
+            }
+            self._remember_media_key(thumbnail_key)
+            self._materialize_image_thumbnail_column(thumbnail_key)
+            link_key = source_key
+            key = thumbnail_key
+        elif key == source_key:
+            self._prepare_image_column(key)
 
         unique_html_id = uuid.uuid4()
         div_arg = f'image_div_{len(self.registered_image_elements)}'
-        image_update_js = (f'    const path = source.data["{key}"][index].replace(/\\\\/g, "/");\n'
-                           "    const encodedPath = encodeURI(path).replace(/#/g, '%23');\n"
+        image_update_js = (f'    const encodedPath = bbdv_media_path(source, "{key}", index);\n'
                            f'    const imageElement = bbdv_find_element({div_arg}, "{unique_html_id}");\n'
-                           "    if (imageElement != null) {\n"
-                           "        imageElement.src = encodedPath;\n"
-                           "    }\n")
-        div_img, callback_img = image_html_and_callback(unique_html_id=unique_html_id,
-                                                        df=self.df, key=key,
-                                                        height=height, width=width,
-                                                        title=title)
+                           "    if (imageElement != null && encodedPath != null) {\n"
+                           "        bbdv_set_image(imageElement, encodedPath);\n"
+                           "    }\n"
+                           f"{image_link_update_js(unique_html_id, link_key, div_var=div_arg)}"
+                           f"{media_prefetch_js(image_keys=[key])}")
+        div_img = image_html(unique_html_id=unique_html_id,
+                             df=self.df, key=key,
+                             height=height, width=width,
+                             title=title, link_key=link_key)
         self.registered_image_elements.append({
             'id': unique_html_id,
             'key': key,
+            'link_key': link_key,
             'legend_text': legend_text,
             'div': div_img,
             'height': height,
@@ -900,12 +1789,7 @@ class BokehBioImageDataVis:
             'div_arg': div_arg,
         })
 
-        img_JS_callback = CustomJS(args=dict(source=self.csd_source, div=div_img),
-                                   code=callback_img)
-
-        img_hover_tool = self._make_hover_tool(img_JS_callback)
-
-        self.scatter_figure.add_tools(img_hover_tool)
+        self._refresh_hover_tool()
 
         return div_img
 
@@ -925,7 +1809,8 @@ class BokehBioImageDataVis:
         """
 
         self.toggleVideoButton.js_on_click(
-            CustomJS(args=dict(video_divs=[element['div'] for element in self.registered_video_elements]),
+            CustomJS(args=dict(video_divs=[element['div'] for element in self.registered_video_elements],
+                               bbdv_helpers=self.bbdv_helpers),
                      code=button_code_video)
         )
         return self.toggleVideoButton
@@ -1077,6 +1962,7 @@ class BokehBioImageDataVis:
             dropdown_model=self.scatterplot_select_options,
             slider_models=[self.manual_id_selection_slider] if hasattr(self, 'manual_id_selection_slider') else [],
             text_hover_divs=[element['div'] for element in self.registered_text_elements],
+            bbdv_helpers=self.bbdv_helpers,
         )
         self.toggleLegendButton.js_on_click(CustomJS(args=legend_args, code=button_code))
 
@@ -1101,33 +1987,26 @@ class BokehBioImageDataVis:
             )
         )
 
-        self.row_refresh_js = ""
-        for registered_video_element in self.registered_video_elements:
-            self.row_refresh_js += self._scope_js_update(registered_video_element['js_update'])
-        for registered_image_element in self.registered_image_elements:
-            self.row_refresh_js += self._scope_js_update(registered_image_element['js_update'])
-        for registered_text_element in self.registered_text_elements:
-            self.row_refresh_js += self._scope_js_update(registered_text_element['js_update'])
-
-        self.row_refresh_js += 'highlight_df.data["highlight_x"][0] = source.data["active_axis_x"][index];\n'
-        self.row_refresh_js += 'highlight_df.data["highlight_y"][0] = source.data["active_axis_y"][index];\n'
-        self.row_refresh_js += 'highlight_df.data["last_selected_index"][0] = index;\n'
-        self.row_refresh_js += 'highlight_df.change.emit();\n'
-        self.row_refresh_js += "source.change.emit();\n"
-        # Trigger video re-synchronisation after all sources have been updated
-        self.row_refresh_js += "if (window._vSync) { window._vSync = {r: new Set(), ok: false}; }\n"
-        callback_slider = BBDV_DOM_HELPER_JS + "const index = manual_id_selection.value;\n" + self.row_refresh_js
+        self.row_refresh_js = self._build_row_refresh_js()
+        # the hover moves the slider once it has shown the row, that row does not need to be refreshed a second time
+        callback_slider = (BBDV_DOM_HELPER_JS + "const index = manual_id_selection.value;\n"
+                           'if (highlight_df.data["last_selected_index"][0] === index) { return; }\n' +
+                           scheduled_row_refresh_js(self.row_refresh_js))
 
         callback_args = dict(source=self.csd_source, manual_id_selection=self.manual_id_selection_slider,
-                             highlight_df=self.highlight_csd_source)
+                             highlight_df=self.highlight_csd_source, axesselect_x=self.axesselect_x,
+                             axesselect_y=self.axesselect_y, bbdv_helpers=self.bbdv_helpers)
         callback_args.update(self._registered_div_args())
         callback = CustomJS(args=callback_args, code=callback_slider)
 
         self.manual_id_selection_slider.js_on_change('value', callback)
+        if self.hover_tool is not None:
+            self._refresh_hover_tool()
         return column([hint_div, self.manual_id_selection_slider])
 
     def add_video_hover(self, key, width=300, height=300, video_width=None, video_height=None, legend_text="",
-                        title=None, autoplay=True):
+                        title=None, autoplay=True, transcode=False, max_bitrate='2M', encoding="h264",
+                        ffmpeg_crf=None, ffmpeg_preset=None, ffmpeg_options=None, poster=False, poster_format='jpg'):
         if self.dataset_selector is not None:
             raise RuntimeError("Please add the dataset selector after adding video hovers.")
         self._require_scatter_figure()
@@ -1139,27 +2018,59 @@ class BokehBioImageDataVis:
             logging.warning("video_height is deprecated, use height instead")
             height = video_height
 
+        # transcode: re-encode for the web instead of linking the originals, i.e. downscaled to the display width,
+        # bitrate capped by max_bitrate, no audio and the moov atom up front so playback starts before the download ends
+        if transcode:
+            if key not in self.df.columns:
+                raise KeyError(f"Could not find video key '{key}' in the dataframe.")
+            resolve_ffmpeg_output_kwargs(encoding, ffmpeg_crf=ffmpeg_crf, ffmpeg_preset=ffmpeg_preset,
+                                         ffmpeg_options=ffmpeg_options)
+            self._ensure_ffmpeg_tools_available()
+            self._remember_media_key(key)
+            web_key = f'_web_video_{uuid.uuid4().hex}'
+            self.generated_media_keys.add(web_key)
+            self.web_video_specs[web_key] = {
+                'key': web_key,
+                'source_key': key,
+                'width': width,
+                'max_bitrate': max_bitrate,
+                'encoding': encoding,
+                'ffmpeg_crf': ffmpeg_crf,
+                'ffmpeg_preset': ffmpeg_preset,
+                'ffmpeg_options': None if ffmpeg_options is None else dict(ffmpeg_options),
+            }
+            self._materialize_web_video_column(web_key)
+            key = web_key
+
         self._remember_media_key(key)
         self._prepare_video_column(key)
         if height is None:
             height = self._get_auto_video_height(key, width)
 
+        # poster: show a still frame (extracted with ffmpeg) until the first hover instead of preloading the video
+        poster_key = self._add_video_poster_key(key, width, poster_format) if poster else None
+
         unique_html_id = uuid.uuid4()
         div_arg = f'video_div_{len(self.registered_video_elements)}'
         video_update_js = (f'    const videoElement = bbdv_find_element({div_arg}, "{unique_html_id}");\n'
                            '    if (videoElement != null) {\n'
                            '        if (!window._bbdvVideos) { window._bbdvVideos = new Set(); }\n'
                            '        window._bbdvVideos.add(videoElement);\n'
-                           f'        videoElement.src = encodeURI(source.data["{key}"][index].replace(/\\\\/g, "/")).replace(/#/g, "%23");\n'
-                           '        videoElement.setAttribute("data-value", index);\n'
+                           f'{video_poster_update_js(poster_key, indent="        ")}'
+                           f'        bbdv_after_dwell("video:{unique_html_id}", {self.video_dwell_ms}, function () {{\n'
+                           f'            bbdv_set_video(videoElement, bbdv_media_path(source, "{key}", index));\n'
+                           '            videoElement.setAttribute("data-value", index);\n'
+                           f'{media_prefetch_js(video_keys=[key], indent="            ")}'
+                           '        });\n'
                            '    }\n')
-        div_video, JS_code = video_html_and_callback(unique_html_id=unique_html_id,
-                                                     df=self.df, key=key,
-                                                     video_width=width, video_height=height,
-                                                     title=title, autoplay=autoplay)
+        div_video = video_html(unique_html_id=unique_html_id,
+                               df=self.df, key=key,
+                               video_width=width, video_height=height,
+                               title=title, autoplay=autoplay, poster_key=poster_key)
         self.registered_video_elements.append({
             'id': unique_html_id,
             'key': key,
+            'poster_key': poster_key,
             'legend_text': legend_text,
             'div': div_video,
             'width': width,
@@ -1171,18 +2082,14 @@ class BokehBioImageDataVis:
         })
         self._refresh_registered_video_divs()
 
-        video_JS_callback = CustomJS(args=dict(source=self.csd_source, div=div_video),
-                                     code=JS_code)
-
-        video_hover_tool = self._make_hover_tool(video_JS_callback)
-
-        self.scatter_figure.add_tools(video_hover_tool)
+        self._refresh_hover_tool()
 
         return div_video
 
     def add_stacked_video_hover(self, keys, stack="column", width=300, height=300, video_width=None,
                                 video_height=None, legend_text="", title=None, autoplay=True,
-                                encoding="h264", ffmpeg_crf=None, ffmpeg_preset=None, ffmpeg_options=None):
+                                encoding="h264", ffmpeg_crf=None, ffmpeg_preset=None, ffmpeg_options=None,
+                                poster=False, poster_format='jpg'):
         if self.dataset_selector is not None:
             raise RuntimeError("Please add the dataset selector after adding stacked video hovers.")
         self._require_scatter_figure()
@@ -1223,6 +2130,8 @@ class BokehBioImageDataVis:
             legend_text=legend_text,
             title=title,
             autoplay=autoplay,
+            poster=poster,
+            poster_format=poster_format,
         )
 
     def create_hover_text(self, df_keys_to_show=None, width=500, height=300, container_width=None, container_height=None,
@@ -1253,19 +2162,13 @@ class BokehBioImageDataVis:
 
 
         div_arg = f'text_div_{len(self.registered_text_elements)}'
-        div_text, code_text, _ = text_html_and_callback(unique_id=unique_html_id,
-                                                        df=self.df, df_keys_to_show=df_keys_to_show,
-                                                        df_keys_to_ignore=df_keys_to_ignore,
-                                                        width=width,
-                                                        height=height,
-                                                        float_precision=self.scatter_data_hover_float_precision)
-        _, _, js_update_str = text_html_and_callback(unique_id=unique_html_id,
-                                                     df=self.df, df_keys_to_show=df_keys_to_show,
-                                                     df_keys_to_ignore=df_keys_to_ignore,
-                                                     width=width,
-                                                     height=height,
-                                                     float_precision=self.scatter_data_hover_float_precision,
-                                                     div_var=div_arg)
+        div_text, js_update_str = text_html_and_update_js(unique_id=unique_html_id,
+                                                          df=self.df, df_keys_to_show=df_keys_to_show,
+                                                          df_keys_to_ignore=df_keys_to_ignore,
+                                                          width=width,
+                                                          height=height,
+                                                          float_precision=self.scatter_data_hover_float_precision,
+                                                          div_var=div_arg)
 
         div_text.css_classes = ["text_hover_display"]
 
@@ -1273,6 +2176,7 @@ class BokehBioImageDataVis:
         self.registered_text_elements.append({
             'id': unique_html_id,
             'js_update': js_update_str,
+            'shown_keys': text_keys_to_show(self.df, df_keys_to_show, df_keys_to_ignore),
             'div': div_text,
             'df_keys_to_show': None if df_keys_to_show is None else list(df_keys_to_show),
             'df_keys_to_ignore': None if df_keys_to_ignore is None else list(df_keys_to_ignore),
@@ -1281,14 +2185,37 @@ class BokehBioImageDataVis:
             'div_arg': div_arg,
         })
 
-        callback_text = CustomJS(args=dict(source=self.csd_source, div=div_text),
-                                 code=code_text)
-
-        hover_text = self._make_hover_tool(callback_text)
-        self.scatter_figure.add_tools(hover_text)
+        self._refresh_hover_tool()
 
         return div_text
 
+    def _media_source_columns(self):
+        # dataframe columns read while preparing media, generated media columns are derived from these
+        columns = set(self.path_keys)
+        for spec in self.stacked_video_specs.values():
+            columns.update(spec['keys'])
+        for specs, source_field in ((self.web_video_specs, 'source_key'), (self.video_poster_specs, 'video_key'),
+                                    (self.image_thumbnail_specs, 'image_key'), (self.tiff_display_specs, 'image_key')):
+            columns.update(spec[source_field] for spec in specs.values())
+        return columns
+
+    def _prepare_media_of_datasets(self, dataset_dfs):
+        media_columns = [key for key in dataset_dfs[0].columns if key in self._media_source_columns()]
+        if not media_columns:
+            return
+        live_df = self.df
+        live_source = self.csd_source
+        # only the media columns of all datasets are stacked, not the datasets themselves
+        self.df = pd.concat([dataset_df[media_columns] for dataset_df in dataset_dfs], ignore_index=True)
+        self.csd_source = ColumnDataSource(data={})
+        try:
+            prepared_media_keys = set()
+            for path_key in self.path_keys:
+                self._prepare_media_key_for_dataset(path_key, prepared_media_keys=prepared_media_keys)
+        finally:
+            self.df = live_df
+            self.csd_source = live_source
+
     def add_dataset_selector(self, datasets, default_dataset=None):
         self._require_scatter_figure()
         if self.dataset_selector is not None:
@@ -1328,6 +2255,11 @@ class BokehBioImageDataVis:
         dataset_labels = []
         dataset_legend_items = []
 
+        # media of all datasets are prepared together first, so that copies and encodes of every dataset share the
+        # worker pools. The per dataset passes below then only look up the shared caches.
+        self._prepare_media_of_datasets([dataset_df for _, dataset_df in dataset_items])
+        used_columns = self._used_columns() if self.prune_unused_columns else None
+
         for dataset_label, dataset_df in dataset_items:
             self.df = dataset_df.copy()
             self.initialize_data()
@@ -1352,6 +2284,12 @@ class BokehBioImageDataVis:
             dataset_labels.append(dataset_label)
             dataset_sources.append(self.csd_source)
             dataset_legend_items.append(legend_items)
+            if dataset_label == default_dataset:
+                default_df = self.df
+            if used_columns is not None:
+                # only the columns written to the page are kept, the prepared dataframe is released with the next
+                # dataset, so memory does not grow with the sum of all datasets
+                self._prune_source(self.csd_source, used_columns)
 
         self.df = live_df
         self.csd_source = live_source
@@ -1362,19 +2300,7 @@ class BokehBioImageDataVis:
 
         refresh_row_js = self.row_refresh_js
         if refresh_row_js is None:
-            refresh_row_js = ""
-            for registered_video_element in self.registered_video_elements:
-                refresh_row_js += self._scope_js_update(registered_video_element['js_update'])
-            for registered_image_element in self.registered_image_elements:
-                refresh_row_js += self._scope_js_update(registered_image_element['js_update'])
-            for registered_text_element in self.registered_text_elements:
-                refresh_row_js += self._scope_js_update(registered_text_element['js_update'])
-            refresh_row_js += 'highlight_df.data["highlight_x"][0] = source.data["active_axis_x"][index];\n'
-            refresh_row_js += 'highlight_df.data["highlight_y"][0] = source.data["active_axis_y"][index];\n'
-            refresh_row_js += 'highlight_df.data["last_selected_index"][0] = index;\n'
-            refresh_row_js += 'highlight_df.change.emit();\n'
-            refresh_row_js += "source.change.emit();\n"
-            refresh_row_js += "if (window._vSync) { window._vSync = {r: new Set(), ok: false}; }\n"
+            refresh_row_js = self._build_row_refresh_js()
 
         selector_args = dict(
             source=self.csd_source,
@@ -1384,6 +2310,7 @@ class BokehBioImageDataVis:
             dataset_sources=self.dataset_sources,
             axesselect_x=self.axesselect_x,
             axesselect_y=self.axesselect_y,
+            bbdv_helpers=self.bbdv_helpers,
         )
         selector_args.update(self._registered_div_args())
         if self.scatter_legend is not None:
@@ -1392,16 +2319,20 @@ class BokehBioImageDataVis:
         if hasattr(self, 'manual_id_selection_slider'):
             selector_args['manual_id_selection'] = self.manual_id_selection_slider
 
+        # with external data, the datasets are sidecar payloads (see _move_data_to_payload), loaded on first selection
+        selector_args['dataset_payloads'] = [None] * len(self.dataset_sources)
         selector_code = BBDV_DOM_HELPER_JS + """
         const dataset_index = dataset_labels.indexOf(dataset_selector.value);
         const selected_source = dataset_sources[dataset_index];
-        const new_data = {};
-        for (const [key, value] of Object.entries(selected_source.data)) {
-            new_data[key] = value.slice ? value.slice() : value;
+        function show_dataset(data) {
+        if (dataset_labels.indexOf(dataset_selector.value) !== dataset_index) {
+            // another dataset was selected while this one was loading
+            return;
         }
-        source.data = new_data;
-        source.data['active_axis_x'] = source.data[axesselect_x.value];
-        source.data['active_axis_y'] = source.data[axesselect_y.value];
+        // the columns are never modified, so the data is swapped instead of copied
+        source.data = data;
+        // directory tables of dictionary encoded path columns
+        source.tags = selected_source.tags;
         """
         if self.scatter_legend is not None:
             selector_code += """
@@ -1412,12 +2343,23 @@ class BokehBioImageDataVis:
         """
         if hasattr(self, 'manual_id_selection_slider'):
             selector_code += """
-        const row_count = source.data["active_axis_x"].length;
+        const row_count = source.data[axesselect_x.value].length;
         manual_id_selection.start = 0;
         manual_id_selection.end = Math.max(row_count - 1, 0);
         manual_id_selection.value = 0;
         """
-        selector_code += "const index = 0;\n" + refresh_row_js
+        # the data changed, so row 0 has to be shown again even if it was shown before
+        selector_code += "const index = 0;\n" + scheduled_row_refresh_js(refresh_row_js, skip_unchanged=False)
+        selector_code += """}
+        const payload = dataset_payloads[dataset_index];
+        if (payload == null) {
+            show_dataset(selected_source.data);
+        } else {
+            bbdv_load_payload(payload[0], payload[1]).then(show_dataset).catch(function (error) {
+                console.error(error);
+            });
+        }
+        """
 
         self.dataset_selector = Select(
             title="Dataset:",
@@ -1426,7 +2368,8 @@ class BokehBioImageDataVis:
             width=self.scatterplot_select_options_width,
         )
         selector_args['dataset_selector'] = self.dataset_selector
-        self.dataset_selector.js_on_change('value', CustomJS(args=selector_args, code=selector_code))
+        self.dataset_selector_callback = CustomJS(args=selector_args, code=selector_code)
+        self.dataset_selector.js_on_change('value', self.dataset_selector_callback)
         self.scatterplot_select_options.children = [self.dataset_selector] + list(self.scatterplot_select_options.children)
 
         default_source = self.dataset_sources[self.dataset_labels.index(default_dataset)]
@@ -1438,10 +2381,10 @@ class BokehBioImageDataVis:
             default_legend_items = self.dataset_legend_items[self.dataset_labels.index(default_dataset)]
             self.scatter_legend.items = default_legend_items
             self.scatter_legend.visible = len(default_legend_items) > 0
-        self.df = pd.DataFrame(self.csd_source.data)
+        self.df = default_df
         self.highlight_csd_source.data = {
-            'highlight_x': [self.csd_source.data['active_axis_x'][0]],
-            'highlight_y': [self.csd_source.data['active_axis_y'][0]],
+            'highlight_x': [self.csd_source.data[self.x_axis_key][0]],
+            'highlight_y': [self.csd_source.data[self.y_axis_key][0]],
             'last_selected_index': [0],
         }
 
@@ -1451,20 +2394,21 @@ class BokehBioImageDataVis:
             self.manual_id_selection_slider.value = 0
 
         for registered_image_element in self.registered_image_elements:
-            image_div, _ = image_html_and_callback(
+            image_div = image_html(
                 unique_html_id=registered_image_element['id'],
                 df=self.df,
                 key=registered_image_element['key'],
                 height=registered_image_element['height'],
                 width=registered_image_element['width'],
                 title=registered_image_element['title'],
+                link_key=registered_image_element['link_key'],
             )
             registered_image_element['div'].text = image_div.text
 
         self._refresh_registered_video_divs()
 
         for registered_text_element in self.registered_text_elements:
-            text_div, _, _ = text_html_and_callback(
+            text_div, _ = text_html_and_update_js(
                 unique_id=registered_text_element['id'],
                 df=self.df,
                 df_keys_to_show=registered_text_element['df_keys_to_show'],
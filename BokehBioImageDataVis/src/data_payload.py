@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import json
+import os
+from os.path import exists, join
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+PAYLOAD_SUBFOLDER = 'data_payloads'
+# dictionary encoded path columns keep the directory code of every row in the column <key>__prefix and the directory
+# table in a ['bbdv_path_prefixes', key, prefixes] tag of the source, see bbdv_path_value
+PATH_PREFIX_SUFFIX = '__prefix'
+PATH_PREFIX_TAG = 'bbdv_path_prefixes'
+# dtypes with a javascript typed array counterpart, see bbdv_decode_column
+_TYPED_ARRAY_DTYPES = ('float32', 'float64', 'int8', 'int16', 'int32', 'uint8', 'uint16', 'uint32')
+
+
+def encode_column(values: Any) -> Any:
+    '''
+    Encodes one column for a data payload: numeric columns become base64 encoded little endian buffers, which the
+    page turns into typed arrays without parsing every number. Everything else stays a plain json list.
+    '''
+    array = np.asarray(values)
+    if np.issubdtype(array.dtype, np.datetime64):
+        # bokeh represents datetimes as milliseconds since epoch
+        array = array.astype('datetime64[ns]').astype(np.int64) / 1e6
+    if array.dtype.kind in 'iuf' and array.ndim == 1:
+        if array.dtype.name not in _TYPED_ARRAY_DTYPES:
+            # 64 bit integers (and float16) have no typed array bokeh can use
+            array = array.astype(np.float64)
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+        return {'dtype': array.dtype.name, 'data': base64.b64encode(array.tobytes()).decode('ascii')}
+    return array.tolist()
+
+
+def encode_path_column(values: Any) -> Tuple[List[str], np.ndarray, List[str]]:
+    '''
+    Splits paths into a table of directory prefixes (including the trailing separator), one prefix code per row and
+    the basenames, so that long directories repeated in every row are only stored once.
+    '''
+    prefixes_of_rows = []
+    basenames = []
+    for value in values:
+        path = str(value)
+        split_index = max(path.rfind('/'), path.rfind('\\')) + 1
+        prefixes_of_rows.append(path[:split_index])
+        basenames.append(path[split_index:])
+    prefixes, codes = np.unique(np.asarray(prefixes_of_rows, dtype=object), return_inverse=True)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if len(prefixes) <= np.iinfo(dtype).max + 1:
+            codes = codes.astype(dtype)
+            break
+    return prefixes.tolist(), codes, basenames
+
+
+def encode_payload(data: Dict[str, Any]) -> str:
+    # the payload is evaluated as javascript, so NaN and Infinity are fine
+    return json.dumps({key: encode_column(values) for key, values in data.items()}, separators=(',', ':'),
+                      default=str)
+
+
+def write_payload(output_folder: str, data: Dict[str, Any]) -> Tuple[str, str]:
+    '''
+    Writes the columns of a data source to a sidecar script in data/data_payloads and returns (payload id, path
+    relative to the output folder). The payload is a script rather than a binary file, because pages opened from
+    file:// may not fetch other files, but may load scripts. Files are named by their content, so an unchanged
+    payload is not written again.
+    '''
+    encoded_payload = encode_payload(data)
+    payload_id = hashlib.sha256(encoded_payload.encode('utf-8')).hexdigest()[:24]
+    output_filename = f'payload_{payload_id}.js'
+    output_dir = join(output_folder, 'data', PAYLOAD_SUBFOLDER)
+    output_path = join(output_dir, output_filename)
+    if not exists(output_path):
+        os.makedirs(output_dir, exist_ok=True)
+        # write to a partial file first, an interrupted export must never leave a truncated payload behind
+        partial_output_path = join(output_dir, f'.partial_{output_filename}')
+        with open(partial_output_path, 'w', encoding='utf-8') as f:
+            f.write(f'(window.bbdv_payloads = window.bbdv_payloads || {{}})["{payload_id}"] = {encoded_payload};\n')
+        os.replace(partial_output_path, output_path)
+    return payload_id, f'data/{PAYLOAD_SUBFOLDER}/{output_filename}'
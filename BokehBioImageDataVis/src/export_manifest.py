@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+from os.path import abspath, exists, join
+from typing import Any, Dict, Optional
+
+MANIFEST_FILENAME = '.bbdv_export_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def stat_signature(path: str) -> Optional[Dict[str, int]]:
+    # a single stat call answers existence, size and modification time at once
+    try:
+        stat_result = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return {'size': stat_result.st_size, 'mtime_ns': stat_result.st_mtime_ns}
+
+
+class ExportManifest:
+    def __init__(self, output_folder: str, filename: str = MANIFEST_FILENAME):
+        '''
+        Persistent record of what previous exports wrote to the output folder, stored next to the html file.
+        Entries are grouped in sections (e.g. 'copy', 'placeholder') and keyed by absolute source path.
+        Each entry stores the size and mtime of the source, so re-runs only need to touch changed sources.
+
+        :param output_folder: output folder of the visualisation
+        :param filename: filename of the manifest inside the output folder
+        '''
+        self.path = join(output_folder, filename)
+        self.sections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.dirty = False
+        self.load()
+
+    def load(self) -> None:
+        if not exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                content = json.load(f)
+        except (OSError, ValueError) as exc:
+            logging.warning(f'Could not read export manifest {self.path}, ignoring it. Reason: {exc}')
+            return
+        if not isinstance(content, dict) or content.get('version') != MANIFEST_VERSION:
+            logging.info(f'Export manifest {self.path} has an unknown version, ignoring it.')
+            return
+        self.sections = content.get('sections', {})
+        logging.info(f'Loaded export manifest with '
+                     f'{sum(len(entries) for entries in self.sections.values())} entries.')
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        # write to a temporary file first, so an interrupted export never leaves a broken manifest behind
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'sections': self.sections}, f)
+        os.replace(temporary_path, self.path)
+        self.dirty = False
+
+    def get_entry(self, section: str, path: str) -> Optional[Dict[str, Any]]:
+        return self.sections.get(section, {}).get(abspath(path))
+
+    def get(self, section: str, path: str, signature: Optional[Dict[str, int]],
+            **params: Any) -> Optional[Dict[str, Any]]:
+        '''
+        Returns the entry for path if it was recorded for the same source signature and parameters, else None.
+        '''
+        entry = self.get_entry(section, path)
+        if entry is None or signature is None:
+            return None
+        if entry.get('size') != signature['size'] or entry.get('mtime_ns') != signature['mtime_ns']:
+            return None
+        for key, value in params.items():
+            if entry.get(key) != value:
+                return None
+        return entry
+
+    def sources_by_output(self, section: str) -> Dict[str, str]:
+        # which source an output (e.g. a copied file) currently belongs to
+        return {entry['output']: path for path, entry in self.sections.get(section, {}).items()
+                if entry.get('output') is not None}
+
+    def set(self, section: str, path: str, signature: Dict[str, int], **values: Any) -> None:
+        entry: Dict[str, Any] = dict(signature)
+        entry.update(values)
+        self.sections.setdefault(section, {})[abspath(path)] = entry
+        self.dirty = True
@@ -1,14 +1,21 @@
+import hashlib
 import logging
 import numbers
 import os
 import shutil
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from os import makedirs
 from os.path import abspath, split, join, basename, splitext, exists, dirname, normpath, getsize
 from typing import Any, Dict, List, Optional, Tuple, cast
 
+import numpy as np
 import pandas as pd
 
+from BokehBioImageDataVis.src.export_manifest import ExportManifest, stat_signature
+
 
 def create_file(filename, content):
     with open(filename, 'w') as f:
@@ -36,10 +43,68 @@ def sanitize_media_path_value(path_value: Any) -> str:
 
 
 def sanitize_media_path_column(df: pd.DataFrame, path_key: str) -> pd.DataFrame:
-    df[path_key] = df[path_key].apply(sanitize_media_path_value)
+    # sanitize every distinct value only once and broadcast the results back via the factorized codes,
+    # missing values get code -1 and therefore pick up the trailing ''
+    codes, uniques = pd.factorize(df[path_key])
+    sanitized_values = np.array([sanitize_media_path_value(value) for value in uniques] + [''], dtype=object)
+    df[path_key] = pd.Series(sanitized_values[codes], index=df.index, dtype=object)
+    return df
+
+
+def apply_path_mapping(df: pd.DataFrame, path_key: str, path_mapping: Dict[str, str]) -> pd.DataFrame:
+    # a single hash lookup per row instead of one full-column replace per mapped path
+    if not path_mapping:
+        return df
+    df[path_key] = df[path_key].map(path_mapping).fillna(df[path_key])
     return df
 
 
+class DirectoryIndex:
+    def __init__(self):
+        '''
+        Caches directory listings, one os.scandir per parent directory, so that existence checks for many files in
+        the same folders do not need one stat call each (slow e.g. on network storage).
+        Only positive answers come from the cache, negative answers are confirmed with os.path.exists, which keeps
+        the index correct on case-insensitive file systems and for files created behind its back.
+        Files created by the export itself should be registered with add().
+        '''
+        self.listings: Dict[str, set] = {}
+        self.lock = threading.Lock()
+
+    def _listing(self, directory: str) -> set:
+        listing = self.listings.get(directory)
+        if listing is None:
+            try:
+                with os.scandir(directory) as entries:
+                    listing = {entry.name for entry in entries}
+            except OSError:
+                listing = set()
+            with self.lock:
+                listing = self.listings.setdefault(directory, listing)
+        return listing
+
+    def exists(self, path: str) -> bool:
+        if not path:
+            return False
+        directory, name = split(abspath(path))
+        if name in self._listing(directory):
+            return True
+        return exists(path)
+
+    def add(self, path: str) -> None:
+        directory, name = split(abspath(path))
+        with self.lock:
+            if directory in self.listings:
+                self.listings[directory].add(name)
+
+    def invalidate(self, directory: Optional[str] = None) -> None:
+        with self.lock:
+            if directory is None:
+                self.listings.clear()
+            else:
+                self.listings.pop(abspath(directory), None)
+
+
 def get_folder_structure(filepath: Any, copy_files_dir_level: int) -> str:
     filepath = sanitize_media_path_value(filepath)
     folders: List[str] = []
@@ -59,13 +124,148 @@ def get_folder_structure(filepath: Any, copy_files_dir_level: int) -> str:
     return cast(str, join(*wanted_folder_structure))
 
 
+COPY_FILES_LAYOUTS = ('tree', 'content')
+COPY_FILES_LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+# linux ioctl request number for cloning a whole file (copy-on-write, btrfs/xfs/...)
+_FICLONE = 0x40049409
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    # blake2b is one of the fastest hashes shipped with hashlib and plenty for content addressing
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _run_in_pool(function, items: List[Any], workers: int = 1) -> List[Any]:
+    workers = max(1, min(int(workers), len(items)))
+    if workers == 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+
+def _reflink_file(src_path: str, target_path: str) -> None:
+    import fcntl
+    with open(src_path, 'rb') as src_file, open(target_path, 'wb') as target_file:
+        fcntl.ioctl(target_file.fileno(), _FICLONE, src_file.fileno())
+
+
+def _link_media_file(src_path: str, target_path: str, link_mode: str) -> None:
+    if link_mode == 'hardlink':
+        os.link(src_path, target_path)
+    elif link_mode == 'symlink':
+        os.symlink(abspath(src_path), target_path)
+    elif link_mode == 'reflink':
+        _reflink_file(src_path, target_path)
+    else:
+        raise ValueError(f'link_mode must be one of {COPY_FILES_LINK_MODES}, got {link_mode}')
+
+
+def _copy_media_file(src_path: str, target_path: str, link_mode: str = 'copy',
+                     overwrite: bool = False) -> Tuple[bool, int]:
+    # check if file exists already, if so, check if it has the same size
+    # if equal, skip copy
+    if not overwrite and exists(target_path) and (getsize(src_path) == getsize(target_path)):
+        logging.debug(f'Info: {target_path} already exists and has the same size. Skipping copy.')
+        return False, 0
+
+    # never write through an existing (hard)link into the original file
+    if os.path.lexists(target_path):
+        os.unlink(target_path)
+
+    if link_mode != 'copy':
+        try:
+            _link_media_file(src_path, target_path, link_mode)
+            return True, getsize(target_path)
+        except (OSError, ImportError) as exc:
+            # e.g. different file systems or no copy-on-write support, a plain copy always works
+            logging.debug(f'Info: could not {link_mode} {src_path} ({exc}). Falling back to copy.')
+            if os.path.lexists(target_path):
+                os.unlink(target_path)
+
+    shutil.copyfile(src_path, target_path)
+    return True, getsize(target_path)
+
+
+def run_copy_jobs(copy_jobs: List[Tuple[str, str, bool]], copy_workers: int = 1, link_mode: str = 'copy') -> int:
+    if not copy_jobs:
+        return 0
+
+    start_time = time.perf_counter()
+    copy_results = _run_in_pool(lambda job: _copy_media_file(job[0], job[1], link_mode, overwrite=job[2]),
+                                copy_jobs, copy_workers)
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+
+    total_bytes = sum(size for _, size in copy_results)
+    copied_files = sum(1 for copied, _ in copy_results if copied)
+    copy_workers = max(1, min(int(copy_workers), len(copy_jobs)))
+    logging.info(f'Copied ({link_mode}) {copied_files}/{len(copy_jobs)} files ({total_bytes / 1e6:.1f} MB) '
+                 f'in {elapsed:.2f}s ({copied_files / elapsed:.1f} files/s, {total_bytes / 1e6 / elapsed:.1f} MB/s) '
+                 f'using {copy_workers} worker(s).')
+    return total_bytes
+
+
+def _reuse_manifest_output(manifest: ExportManifest, src_path: str, signature: Optional[Dict[str, int]],
+                           output_folder: str, **params: Any) -> Tuple[Optional[str], bool]:
+    '''
+    Checks the export manifest for an earlier copy of src_path.
+    Returns the relative output path if it can be reused, and whether an outdated entry exists for the source.
+    '''
+    entry = manifest.get_entry('copy', src_path)
+    if entry is None or signature is None:
+        return None, False
+    if any(entry.get(key) != value for key, value in params.items()):
+        return None, True
+
+    target_signature = stat_signature(join(output_folder, entry['output']))
+    if target_signature is None or target_signature['size'] != signature['size']:
+        return None, True
+
+    if manifest.get('copy', src_path, signature, **params) is not None:
+        return entry['output'], False
+
+    # only the timestamp changed (e.g. touched or re-saved file), if a hash was recorded, compare the content
+    if entry.get('hash') is not None and entry.get('size') == signature['size'] and \
+            hash_file(src_path) == entry['hash']:
+        manifest.set('copy', src_path, signature, **{key: value for key, value in entry.items()
+                                                      if key not in signature})
+        return entry['output'], False
+
+    return None, True
+
+
 def copy_files_to_output_dir(df: pd.DataFrame, path_key: str, output_folder: str,
                              used_paths: List[str], copy_files_dir_level: int,
-                             copied_paths_by_source: Optional[Dict[str, str]] = None) -> Tuple[pd.DataFrame, List[str]]:
+                             copied_paths_by_source: Optional[Dict[str, str]] = None,
+                             copy_workers: int = 1,
+                             layout: str = 'tree',
+                             link_mode: str = 'copy',
+                             manifest: Optional[ExportManifest] = None,
+                             record_hashes: bool = False,
+                             directory_index: Optional[DirectoryIndex] = None) -> Tuple[pd.DataFrame, List[str]]:
+    if layout not in COPY_FILES_LAYOUTS:
+        raise ValueError(f'layout must be one of {COPY_FILES_LAYOUTS}, got {layout}')
+    if link_mode not in COPY_FILES_LINK_MODES:
+        raise ValueError(f'link_mode must be one of {COPY_FILES_LINK_MODES}, got {link_mode}')
+
     df = sanitize_media_path_column(df, path_key)
     if copied_paths_by_source is None:
         copied_paths_by_source = {}
 
+    path_mapping: Dict[str, str] = {}
+    used_paths_lookup = set(used_paths)
+    manifest_params = {'layout': layout, 'link_mode': link_mode,
+                       'dir_level': copy_files_dir_level if layout == 'tree' else None}
+
+    # sources that actually need to end up in the output folder, with their stat signature
+    pending_sources: List[Tuple[str, str, Dict[str, int]]] = []
+    outdated_sources = set()
+    reused_files = 0
+
     for raw_src_path in df[path_key].unique():
         src_path = cast(str, sanitize_media_path_value(raw_src_path))
 
@@ -73,33 +273,92 @@ def copy_files_to_output_dir(df: pd.DataFrame, path_key: str, output_folder: str
             logging.warning(f'Warning: empty path. Skipping copy.')
             continue
 
-        output_local_path = normpath(join(output_folder, src_path))
-        if not os.path.isabs(src_path) and exists(output_local_path):
-            logging.debug(f'Info: {src_path} already exists inside the output folder. Skipping copy.')
-            continue
-
         normalized_source_path = abspath(normpath(src_path))
         if normalized_source_path in copied_paths_by_source:
-            df[path_key] = df[path_key].replace(src_path, copied_paths_by_source[normalized_source_path])
+            path_mapping[src_path] = copied_paths_by_source[normalized_source_path]
             continue
 
-        if not exists(src_path):
+        signature = None
+        if manifest is not None and manifest.get_entry('copy', normalized_source_path) is not None:
+            # checked before the output folder lookup below, so that edited sources are noticed on re-runs
+            signature = stat_signature(src_path)
+            reused_path, outdated = _reuse_manifest_output(manifest, normalized_source_path, signature,
+                                                           output_folder, **manifest_params)
+            if reused_path is not None:
+                target_path = cast(str, join(output_folder, reused_path))
+                used_paths.append(target_path)
+                used_paths_lookup.add(target_path)
+                copied_paths_by_source[normalized_source_path] = reused_path
+                path_mapping[src_path] = reused_path
+                reused_files += 1
+                continue
+            if outdated:
+                outdated_sources.add(normalized_source_path)
+
+        output_local_path = normpath(join(output_folder, src_path))
+        output_local_exists = directory_index.exists if directory_index is not None else exists
+        if normalized_source_path not in outdated_sources and not os.path.isabs(src_path) and \
+                output_local_exists(output_local_path):
+            logging.debug(f'Info: {src_path} already exists inside the output folder. Skipping copy.')
+            continue
+
+        if signature is None:
+            signature = stat_signature(src_path)
+        if signature is None:
             logging.warning(f'Warning: {src_path} does not exist. Skipping copy.')
             continue
 
+        pending_sources.append((src_path, normalized_source_path, signature))
+
+    if reused_files:
+        logging.info(f'Reused {reused_files} unchanged files from the export manifest for {path_key}.')
+
+    # content addressed layout: data/content/<first two hex digits>/<hash><ext>, identical files are stored once
+    content_hashes: List[Optional[str]] = [None] * len(pending_sources)
+    if layout == 'content' or (manifest is not None and record_hashes):
+        content_hashes = _run_in_pool(lambda source: hash_file(source[0]), pending_sources, copy_workers)
+
+    # target paths are resolved serially in order of appearance, so collision handling and bookkeeping do not
+    # depend on the number of workers; only the actual copies are handed to the thread pool afterwards
+    copy_jobs: List[Tuple[str, str, bool]] = []
+    deduplicated_files = 0
+    # outputs of earlier exports belong to their source, another source with the same target path gets its own file.
+    # Content addressed outputs are shared on purpose.
+    manifest_sources_by_output = manifest.sources_by_output('copy') if manifest is not None and layout == 'tree' \
+        else {}
+
+    for (src_path, normalized_source_path, signature), content_hash in zip(pending_sources, content_hashes):
         filename = cast(str, basename(src_path))
-        folder_structure_to_copy = cast(str, get_folder_structure(src_path, copy_files_dir_level))
+        if layout == 'content':
+            content_hash = cast(str, content_hash)
+            folder_structure_to_copy = join('content', content_hash[:2])
+            filename = f'{content_hash}{splitext(filename)[1]}'
+        else:
+            folder_structure_to_copy = cast(str, get_folder_structure(src_path, copy_files_dir_level))
 
         target_path = cast(str, join(output_folder, 'data', folder_structure_to_copy, filename))
         logging.debug(f'copy {src_path} to {target_path}')
 
-        if target_path in used_paths:
+        target_path_relative = cast(str, join('data', folder_structure_to_copy, filename))
+        if layout == 'content' and target_path in used_paths_lookup:
+            # same content was already placed, just point to it
+            deduplicated_files += 1
+            copied_paths_by_source[normalized_source_path] = target_path_relative
+            path_mapping[src_path] = target_path_relative
+            if manifest is not None:
+                manifest.set('copy', normalized_source_path, signature, output=target_path_relative,
+                             hash=content_hash, **manifest_params)
+            continue
+
+        if target_path in used_paths_lookup or \
+                manifest_sources_by_output.get(target_path_relative, normalized_source_path) != normalized_source_path:
             logging.warning(f'Warning: filename {filename} already used. Adding unique id to filename.')
             filename_no_ext, ext = splitext(filename)
             filename = f'{filename_no_ext}_{uuid.uuid4()}{ext}'
             target_path = cast(str, join(output_folder, 'data', folder_structure_to_copy, filename))
 
         used_paths.append(target_path)
+        used_paths_lookup.add(target_path)
 
         if not exists(dirname(target_path)):
             makedirs(dirname(target_path))
@@ -109,18 +368,26 @@ def copy_files_to_output_dir(df: pd.DataFrame, path_key: str, output_folder: str
             logging.warning('Warning: src and target path are the same. Skipping copy.')
             continue
 
-        # check if file exists already, if so, check if it has the same size
-        # if equal, skip copy
-        if exists(target_path) and (getsize(src_path) == getsize(target_path)):
-            logging.debug(f'Info: {target_path} already exists and has the same size. Skipping copy.')
-        else:
-            shutil.copyfile(src_path, target_path)
+        # with a manifest, existing files are only kept for the unchanged sources they were recorded for (reused
+        # above). Sources that changed or are not in the manifest yet are copied even if the size did not change.
+        copy_jobs.append((src_path, target_path, manifest is not None))
 
         # update old path to new relative path 'data/...'
         target_path_relative = cast(str, join('data', folder_structure_to_copy, filename))
         copied_paths_by_source[normalized_source_path] = target_path_relative
 
-        # escape # in the path
-        df[path_key] = df[path_key].replace(src_path, target_path_relative)
+        path_mapping[src_path] = target_path_relative
+        if manifest is not None:
+            manifest.set('copy', normalized_source_path, signature, output=target_path_relative,
+                         hash=content_hash, **manifest_params)
+
+    if deduplicated_files:
+        logging.info(f'Deduplicated {deduplicated_files} files with identical content for {path_key}.')
+
+    df = apply_path_mapping(df, path_key, path_mapping)
+    run_copy_jobs(copy_jobs, copy_workers=copy_workers, link_mode=link_mode)
+    if directory_index is not None:
+        for _, target_path, _ in copy_jobs:
+            directory_index.add(target_path)
 
     return df, used_paths
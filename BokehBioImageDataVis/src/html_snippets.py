@@ -1,5 +1,6 @@
 import logging
-from bokeh.models import Div
+import re
+from bokeh.models import CustomJS, Div
 from pandas.api.types import is_float_dtype
 
 from BokehBioImageDataVis.src.file_handling import sanitize_media_path_value
@@ -8,7 +9,15 @@ from BokehBioImageDataVis.src.utils import detect_if_key_is_float
 from urllib.parse import quote
 
 
-BBDV_DOM_HELPER_JS = r"""
+# the helpers are installed once per page on window.bbdv by the first callback that runs, see BBDV_DOM_HELPER_JS
+BBDV_HELPERS_JS = r"""
+// context of the callback that currently uses the helpers, Bokeh 2.4 has no cb_context
+let bbdv_context = null;
+
+function bbdv_use_context(context) {
+    bbdv_context = context;
+}
+
 function bbdv_normalize_view(value) {
     const view = Array.isArray(value) ? value[value.length - 1] : value;
     return view != null && view.model != null ? view : null;
@@ -110,8 +119,8 @@ function bbdv_get_view(model) {
     }
     const model_id = model.id;
     const indexes = [];
-    if (typeof cb_context !== "undefined" && cb_context != null && cb_context.index != null) {
-        indexes.push(cb_context.index);
+    if (bbdv_context != null && bbdv_context.index != null) {
+        indexes.push(bbdv_context.index);
     }
     if (typeof Bokeh !== "undefined" && Bokeh.index != null) {
         indexes.push(Bokeh.index);
@@ -194,18 +203,309 @@ function bbdv_query_all(models, selector) {
     return results;
 }
 
+// resolving an element walks the view tree, so resolved elements are kept per model and element id. An entry is
+// dropped once its element left the page, e.g. because bokeh re-rendered the div.
+const bbdv_element_cache = new Map();
+
 function bbdv_find_element(model, element_id) {
+    const cache_key = `${model != null ? model.id : ""}:${element_id}`;
+    const cached = bbdv_element_cache.get(cache_key);
+    if (cached != null) {
+        if (cached.isConnected) {
+            return cached;
+        }
+        bbdv_element_cache.delete(cache_key);
+    }
     const selector = `[data-bbdv-id="${element_id}"], [id="${element_id}"]`;
-    const element = bbdv_query_element(model, selector);
-    if (element != null) {
-        return element;
+    let element = bbdv_query_element(model, selector);
+    if (element == null && typeof document !== "undefined") {
+        element = document.getElementById(element_id);
     }
-    if (typeof document !== "undefined") {
-        return document.getElementById(element_id);
+    if (element != null && element.isConnected) {
+        bbdv_element_cache.set(cache_key, element);
+    }
+    return element;
+}
+
+// decoded images and fetched video blobs are kept in small LRU caches shared by all callbacks of the page
+function bbdv_media_cache() {
+    if (window._bbdvMediaCache == null) {
+        window._bbdvMediaCache = {images: new Map(), videos: new Map(), image_limit: 64, video_limit: 4,
+                                  deferred_video_urls: new Set()};
+    }
+    return window._bbdvMediaCache;
+}
+
+function bbdv_lru_touch(map, key) {
+    const value = map.get(key);
+    if (value !== undefined) {
+        map.delete(key);
+        map.set(key, value);
+    }
+    return value;
+}
+
+function bbdv_lru_insert(map, key, value, limit, on_evict) {
+    map.delete(key);
+    map.set(key, value);
+    while (map.size > limit) {
+        const oldest = map.entries().next().value;
+        map.delete(oldest[0]);
+        if (on_evict != null) {
+            on_evict(oldest[1]);
+        }
+    }
+}
+
+function bbdv_path_prefixes(source, key) {
+    for (const tag of source.tags || []) {
+        if (Array.isArray(tag) && tag[0] === "bbdv_path_prefixes" && tag[1] === key) {
+            return tag[2];
+        }
     }
     return null;
 }
 
+function bbdv_path_value(source, key, index) {
+    // dictionary encoded path columns store basenames plus a code into the directory table, see data_payload.py
+    const column = source.data[key];
+    if (column == null || index == null || index < 0 || index >= column.length || column[index] == null) {
+        return null;
+    }
+    const codes = source.data[key + "__prefix"];
+    if (codes == null) {
+        return String(column[index]);
+    }
+    const prefixes = bbdv_path_prefixes(source, key);
+    return (prefixes != null ? prefixes[codes[index]] : "") + column[index];
+}
+
+function bbdv_media_path(source, key, index) {
+    const path = bbdv_path_value(source, key, index);
+    if (path == null) {
+        return null;
+    }
+    return encodeURI(path.replace(/\\/g, "/")).replace(/#/g, "%23");
+}
+
+function bbdv_load_image(path) {
+    const cache = bbdv_media_cache();
+    let entry = bbdv_lru_touch(cache.images, path);
+    if (entry === undefined) {
+        const image = new Image();
+        image.decoding = "async";
+        image.src = path;
+        const decoded = typeof image.decode === "function" ? image.decode().catch(function () {}) : Promise.resolve();
+        entry = {image: image, decoded: decoded.then(function () { return image; })};
+        bbdv_lru_insert(cache.images, path, entry, cache.image_limit);
+    }
+    return entry.decoded;
+}
+
+function bbdv_set_image(image_element, path) {
+    // swap only once the image is decoded; a request that was overtaken by a newer one is dropped
+    image_element._bbdvPendingSrc = path;
+    bbdv_load_image(path).then(function () {
+        if (image_element._bbdvPendingSrc === path && image_element.getAttribute("src") !== path) {
+            image_element.src = path;
+        }
+    });
+}
+
+function bbdv_video_url_in_use(url) {
+    if (window._bbdvVideos == null) {
+        return false;
+    }
+    for (const video of Array.from(window._bbdvVideos)) {
+        if (video.src === url) {
+            return true;
+        }
+    }
+    return false;
+}
+
+function bbdv_release_video(entry) {
+    if (entry.controller != null) {
+        entry.controller.abort();
+        entry.controller = null;
+    }
+    if (entry.url == null) {
+        return;
+    }
+    if (bbdv_video_url_in_use(entry.url)) {
+        // revoked by bbdv_set_video once the video element shows another source
+        bbdv_media_cache().deferred_video_urls.add(entry.url);
+    } else {
+        URL.revokeObjectURL(entry.url);
+    }
+}
+
+function bbdv_prefetch_video(path) {
+    const cache = bbdv_media_cache();
+    if (cache.videos.has(path) || typeof fetch !== "function") {
+        return;
+    }
+    // failed fetches (e.g. pages opened from file://) stay in the cache as well, so they are not retried
+    const entry = {url: null, controller: typeof AbortController === "function" ? new AbortController() : null};
+    bbdv_lru_insert(cache.videos, path, entry, cache.video_limit, bbdv_release_video);
+    fetch(path, entry.controller != null ? {signal: entry.controller.signal} : {}).then(function (response) {
+        if (!response.ok) {
+            throw new Error(response.statusText);
+        }
+        return response.blob();
+    }).then(function (blob) {
+        entry.controller = null;
+        if (cache.videos.get(path) === entry) {
+            entry.url = URL.createObjectURL(blob);
+        }
+    }).catch(function () {});
+}
+
+function bbdv_set_video(video_element, path) {
+    const cache = bbdv_media_cache();
+    const entry = bbdv_lru_touch(cache.videos, path);
+    const previous_url = video_element.src;
+    video_element.src = entry !== undefined && entry.url != null ? entry.url : path;
+    if (cache.deferred_video_urls.has(previous_url) && !bbdv_video_url_in_use(previous_url)) {
+        cache.deferred_video_urls.delete(previous_url);
+        URL.revokeObjectURL(previous_url);
+    }
+}
+
+function bbdv_neighbour_rows(index, count) {
+    const rows = [];
+    for (let offset = 1; offset <= count; offset++) {
+        rows.push(index + offset, index - offset);
+    }
+    return rows;
+}
+
+function bbdv_prefetch_rows(source, image_keys, video_keys, rows) {
+    for (const row of rows) {
+        for (const key of image_keys) {
+            const path = bbdv_media_path(source, key, row);
+            if (path != null) {
+                bbdv_load_image(path);
+            }
+        }
+        for (const key of video_keys) {
+            const path = bbdv_media_path(source, key, row);
+            if (path != null) {
+                bbdv_prefetch_video(path);
+            }
+        }
+    }
+}
+
+// hover sweeps fire callbacks many times per frame: only the latest update per slot runs, once per animation frame
+function bbdv_scheduler() {
+    if (window._bbdvScheduler == null) {
+        window._bbdvScheduler = {pending: new Map(), frame: null, timers: new Map()};
+    }
+    return window._bbdvScheduler;
+}
+
+function bbdv_schedule_update(slot, update) {
+    const scheduler = bbdv_scheduler();
+    scheduler.pending.set(slot, update);
+    if (scheduler.frame != null) {
+        return;
+    }
+    const request_frame = typeof requestAnimationFrame === "function"
+        ? requestAnimationFrame : function (run) { return setTimeout(run, 16); };
+    scheduler.frame = request_frame(function () {
+        scheduler.frame = null;
+        const updates = Array.from(scheduler.pending.values());
+        scheduler.pending.clear();
+        for (const run of updates) {
+            try {
+                run();
+            } catch (error) {
+                console.error(error);
+            }
+        }
+    });
+}
+
+function bbdv_after_dwell(slot, delay_ms, update) {
+    // runs update once the slot was not requested again for delay_ms, e.g. to not start a video load per passed point
+    const scheduler = bbdv_scheduler();
+    clearTimeout(scheduler.timers.get(slot));
+    scheduler.timers.delete(slot);
+    if (!(delay_ms > 0)) {
+        update();
+        return;
+    }
+    scheduler.timers.set(slot, setTimeout(function () {
+        scheduler.timers.delete(slot);
+        update();
+    }, delay_ms));
+}
+
+// data payloads are sidecar scripts, see data_payload.py. The last few decoded payloads are kept, so switching
+// back and forth between datasets does not load and decode them again.
+const bbdv_payload_cache = new Map();
+const bbdv_payload_cache_limit = 4;
+
+function bbdv_decode_column(column) {
+    if (column == null || Array.isArray(column) || column.dtype == null) {
+        return column;
+    }
+    const binary = atob(column.data);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    const array_types = {
+        float32: Float32Array, float64: Float64Array, int8: Int8Array, int16: Int16Array, int32: Int32Array,
+        uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array,
+    };
+    return new array_types[column.dtype](bytes.buffer);
+}
+
+function bbdv_load_payload(path, payload_id) {
+    let request = bbdv_lru_touch(bbdv_payload_cache, payload_id);
+    if (request === undefined) {
+        request = new Promise(function (resolve, reject) {
+            const script = document.createElement("script");
+            script.src = path;
+            script.onload = function () {
+                const payloads = window.bbdv_payloads || {};
+                const columns = payloads[payload_id];
+                // the decoded columns are kept by the caller, the encoded ones are not needed anymore
+                delete payloads[payload_id];
+                script.remove();
+                if (columns == null) {
+                    reject(new Error(`${path} does not contain data payload ${payload_id}`));
+                    return;
+                }
+                const data = {};
+                for (const [key, column] of Object.entries(columns)) {
+                    data[key] = bbdv_decode_column(column);
+                }
+                resolve(data);
+            };
+            script.onerror = function () {
+                bbdv_payload_cache.delete(payload_id);
+                script.remove();
+                reject(new Error(`Could not load data payload ${path}, is the data folder next to the html file?`));
+            };
+            document.head.appendChild(script);
+        });
+        bbdv_lru_insert(bbdv_payload_cache, payload_id, request, bbdv_payload_cache_limit);
+    }
+    return request;
+}
+
+function bbdv_after_paint(update) {
+    // two frames: the first one is painted before the update runs
+    const request_frame = typeof requestAnimationFrame === "function"
+        ? requestAnimationFrame : function (run) { return setTimeout(run, 16); };
+    request_frame(function () {
+        setTimeout(update, 0);
+    });
+}
+
 function bbdv_registered_videos(models) {
     const videos = bbdv_query_all(models, "video");
     if (window._bbdvVideos != null) {
@@ -218,10 +518,68 @@ function bbdv_registered_videos(models) {
     return videos;
 }
 """
+BBDV_HELPER_NAMES = re.findall(r'^function (bbdv_\w+)\(', BBDV_HELPERS_JS, flags=re.MULTILINE)
+BBDV_HELPERS_JS += f'window.bbdv = {{{", ".join(f"{name}: {name}" for name in BBDV_HELPER_NAMES)}}};\n'
 
+# prepended to every callback that uses the helpers, the callback needs a bbdv_helpers arg (see helpers_model)
+BBDV_DOM_HELPER_JS = (
+    'if (window.bbdv == null) { (new Function(bbdv_helpers.code))(); }\n'
+    f'const {{{", ".join(BBDV_HELPER_NAMES)}}} = window.bbdv;\n'
+    'bbdv_use_context(typeof cb_context !== "undefined" ? cb_context : null);\n'
+)
 
-def image_html_and_callback(unique_html_id, df, key, height=None, width=None, image_height=None, image_width=None,
-                            title=None, margin_title=5):
+
+def helpers_model():
+    # the helper source is shipped once as the code of this model; it is never attached to an event, the callbacks
+    # only evaluate its code. CustomJS.execute can not be used for this, it is asynchronous in newer Bokeh versions.
+    return CustomJS(code=BBDV_HELPERS_JS)
+
+
+# rows around the shown one whose media are loaded ahead: images for the slider and for the other points under the
+# mouse, videos only for the slider neighbours once the video dwell time has passed
+PREFETCH_ROWS = 2
+
+
+def payload_load_js(payload_path, payload_id, source_var='source'):
+    # replaces the (empty) columns of a source with its sidecar data payload, once the page has been painted.
+    # If other data was shown in the meantime (e.g. another dataset was selected), that data is kept.
+    return (f'const empty_data = {source_var}.data;\n'
+            f'bbdv_after_paint(function () {{\n'
+            f'    bbdv_load_payload("{payload_path}", "{payload_id}").then(function (data) {{\n'
+            f'        if ({source_var}.data === empty_data) {{\n'
+            f'            {source_var}.data = data;\n'
+            f'        }}\n'
+            f'    }}).catch(function (error) {{ console.error(error); }});\n'
+            f'}});\n')
+
+
+def media_prefetch_js(image_keys=(), video_keys=(), rows_expression=f'bbdv_neighbour_rows(index, {PREFETCH_ROWS})',
+                      indent='    '):
+    image_keys_js = ', '.join(f'"{key}"' for key in image_keys)
+    video_keys_js = ', '.join(f'"{key}"' for key in video_keys)
+    return f'{indent}bbdv_prefetch_rows(source, [{image_keys_js}], [{video_keys_js}], {rows_expression});\n'
+
+
+def scheduled_row_refresh_js(row_refresh_js, skip_unchanged=True):
+    # hover, slider and dataset selector share one slot, the refresh requested last before the next frame replaces
+    # the earlier ones. The hover only moves the slider from within its refresh, so the two never compete for a frame.
+    skip_js = ('    if (highlight_df.data["last_selected_index"][0] === index) { return; }\n'
+               if skip_unchanged else '')
+    indented_refresh_js = ''.join(f'    {line}\n' if line else '\n' for line in row_refresh_js.splitlines())
+    return f'bbdv_schedule_update("row", function () {{\n{skip_js}{indented_refresh_js}}});\n'
+
+
+def image_link_update_js(unique_html_id, link_key, div_var='div', indent='    '):
+    if link_key is None:
+        return ''
+    return (f'{indent}const linkElement = bbdv_find_element({div_var}, "{unique_html_id}-link");\n'
+            f'{indent}if (linkElement != null) {{\n'
+            f'{indent}    linkElement.href = bbdv_media_path(source, "{link_key}", index);\n'
+            f'{indent}}}\n')
+
+
+def image_html(unique_html_id, df, key, height=None, width=None, image_height=None, image_width=None, title=None,
+               margin_title=5, link_key=None):
     # deprecated: image_height and image_width
     if image_height is not None:
         logging.warning('Warning: image_height is deprecated. Use height instead.')
@@ -255,32 +613,32 @@ def image_html_and_callback(unique_html_id, df, key, height=None, width=None, im
     # escape # in the path
     path_to_image = quote(path_to_image)
     path_to_image = path_to_image.replace('#', '%23')
+    # a downscaled image still links to its original
+    if link_key is not None:
+        path_to_link = quote(sanitize_media_path_value(df[link_key].iloc[0]).replace('\\', '/'))
+        path_to_link = path_to_link.replace('#', '%23')
+        link_open = (f'  <a href="{path_to_link}" target="_blank" id="{unique_html_id}-link" '
+                     f'data-bbdv-id="{unique_html_id}-link" style="display: contents">\n')
+        link_close = '  </a>\n'
+    else:
+        link_open = ''
+        link_close = ''
     html_img = (f'<div style="position: relative; display: flex; flex-direction: column; justify-content: center; align-items: center; {image_height_str} {image_width_str}">\n'
                 f'{title_html}'
+                f'{link_open}'
                 f'  <img\n'
                 f'    src="{path_to_image}"\n'
                 f'    id="{unique_html_id}"\n'
                 f'    data-bbdv-id="{unique_html_id}"\n'
                 '    style="width: 100%; max-height: 100%; margin: 0px 15px 15px 0px; object-fit: contain"\n'
                 '   ></img>\n'
+                f'{link_close}'
                 '</div>')
 
     div_img = Div(width=width, height=height, width_policy="fixed",
                   text=html_img)
 
-    callback_img = (BBDV_DOM_HELPER_JS +
-                    "const indices = cb_data.index.indices\n"
-                    "if(indices.length > 0){\n"
-                    "    const index = indices[0];\n"
-                    f'    const path = source.data["{key}"][index].replace(/\\\\/g, "/");\n'
-                    "    const encodedPath = encodeURI(path).replace(/#/g, '%23');\n"
-                    f'    const imageElement = bbdv_find_element(div, "{unique_html_id}");\n'
-                    "    if (imageElement != null) {\n"
-                    "        imageElement.src = encodedPath;\n"
-                    "    }\n"
-                    "}")
-
-    return div_img, callback_img
+    return div_img
 
 
 def get_index_0_text(df, df_keys_to_show):
@@ -289,8 +647,6 @@ def get_index_0_text(df, df_keys_to_show):
     for key, value in row.items():
         if key not in df_keys_to_show:
             continue
-        if key == 'active_axis_x' or key == 'active_axis_y':
-            continue
         # there is an problem sometimes with identifying floats.
         #saving and reloading a dataframe fixes this, but this also should deal with most cases
         if is_float_dtype(value) or isinstance(value, float):
@@ -300,8 +656,15 @@ def get_index_0_text(df, df_keys_to_show):
             lines.append(f"<b>{key}</b>: {value}<br>")
     return ''.join(lines)
 
-def text_html_and_callback(unique_id, df, df_keys_to_show, float_precision, width, height,
-                           container_width=None, container_height=None, df_keys_to_ignore=None, div_var='div'):
+def text_keys_to_show(df, df_keys_to_show=None, df_keys_to_ignore=None):
+    # keys shown by a hover text, in order
+    if df_keys_to_show is None:
+        df_keys_to_show = list(df.keys())
+    df_keys_to_ignore = df_keys_to_ignore or []
+    return [key for key in df_keys_to_show if key not in df_keys_to_ignore]
+
+def text_html_and_update_js(unique_id, df, df_keys_to_show, float_precision, width, height,
+                            container_width=None, container_height=None, df_keys_to_ignore=None, div_var='div'):
     # deprecated: container_width, container_height
     if container_width is not None:
         width = container_width
@@ -310,40 +673,29 @@ def text_html_and_callback(unique_id, df, df_keys_to_show, float_precision, widt
         height = container_height
         logging.warning("container_height is deprecated. Use height instead.")
 
-    prefix = (BBDV_DOM_HELPER_JS +
-              "const indices = cb_data.index.indices;\n"
-              "if(indices.length > 0){\n"
-              "    const index = indices[0];")
-
     combined_str = ""
     assignment_char = '='
-    if df_keys_to_show is None:
-        df_keys_to_show = list(df.keys())
-    if df_keys_to_ignore is not None:
-        for key in df_keys_to_ignore:
-            if key in df_keys_to_show:
-                df_keys_to_show.remove(key)
+    df_keys_to_show = text_keys_to_show(df, df_keys_to_show, df_keys_to_ignore)
     for key in df_keys_to_show:
-        if key == 'active_axis_x' or key == 'active_axis_y':
-            continue
         #         # there is an problem sometimes with identifying floats.
         #         # saving and reloading a dataframe fixes this, but this also should deal with most cases
         if detect_if_key_is_float(df, key):
-            line = f'        textElement.innerHTML {assignment_char} ' \
+            line = f'        textHtml {assignment_char} ' \
                    f'"<b>{key}</b>:" + " " + source.data["{key}"][index]' \
                    f'.toFixed({float_precision}).toString() + "<br>";\n'
         else:
-            line = f'        textElement.innerHTML {assignment_char} ' \
+            line = f'        textHtml {assignment_char} ' \
                    f'"<b>{key}</b>:" + " " + source.data["{key}"][index].toString() + "<br>";\n'
         assignment_char = '+='
         combined_str += line
 
+    # the html is assigned once, every innerHTML assignment makes the browser parse and lay out the element again
     js_update_str = (f'    const textElement = bbdv_find_element({div_var}, "{unique_id}");\n'
                      '    if (textElement != null) {\n'
+                     '        let textHtml = "";\n'
                      f'{combined_str}'
+                     '        textElement.innerHTML = textHtml;\n'
                      '    }\n')
-    postfix = "}"
-    callback_text = f'{prefix}\n{js_update_str}\n{postfix}'
 
     index_0_text = get_index_0_text(df, df_keys_to_show=df_keys_to_show)
 
@@ -351,11 +703,17 @@ def text_html_and_callback(unique_id, df, df_keys_to_show, float_precision, widt
                    text=f"<div id='{unique_id}' data-bbdv-id='{unique_id}' style='clear:left; float: left; margin: 0px 15px 15px 0px;';>"
                         f"{index_0_text}"
                         f"</div>")
-    return div_text, callback_text, js_update_str
+    return div_text, js_update_str
+
+
+def video_poster_update_js(poster_key, indent='    '):
+    if poster_key is None:
+        return ''
+    return f'{indent}videoElement.poster = bbdv_media_path(source, "{poster_key}", index);\n'
 
 
-def video_html_and_callback(unique_html_id, df, key, video_height=None, video_width=None, title=None,
-                            margin_title=5, autoplay=True, sync_count=1):
+def video_html(unique_html_id, df, key, video_height=None, video_width=None, title=None,
+               margin_title=5, autoplay=True, sync_count=1, poster_key=None):
     if video_height is not None:
         video_height_str = f'height:{video_height}px;'
     else:
@@ -406,36 +764,25 @@ def video_html_and_callback(unique_html_id, df, key, video_height=None, video_wi
     path_to_video = quote(path_to_video)
     path_to_video = path_to_video.replace('#', '%23')
 
+    # with a poster, the page only shows the poster image; the video stream is swapped in on the first hover
+    if poster_key is not None:
+        path_to_poster = quote(sanitize_media_path_value(df[poster_key].iloc[0]).replace('\\', '/'))
+        path_to_poster = path_to_poster.replace('#', '%23')
+        poster_attr = f'poster="{path_to_poster}" '
+        source_html = ''
+    else:
+        poster_attr = ''
+        source_html = f'        <source src="{path_to_video}" type="video/mp4">'
+
     html_string = (
         f'<div style="position: relative; display: flex; flex-direction: column; justify-content: center; align-items: center; {video_height_str} {video_width_str}">'
         f'{title_html}'
-        f'    <video controls {autoplay_attr}preload="auto" muted loop id="{unique_html_id}" data-bbdv-id="{unique_html_id}" data-bbdv-sync-count="{sync_count}" class="{sync_class}"{sync_events} data-value="firstvalue" style="width: 100%; max-height: 100%; object-fit: contain">'
-        f'        <source src="{path_to_video}" type="video/mp4">'
+        f'    <video controls {autoplay_attr}{poster_attr}preload="metadata" muted loop id="{unique_html_id}" data-bbdv-id="{unique_html_id}" data-bbdv-sync-count="{sync_count}" class="{sync_class}"{sync_events} data-value="firstvalue" style="width: 100%; max-height: 100%; object-fit: contain">'
+        f'{source_html}'
         f'        Your browser does not support the video tag.'
         '    </video>'
         '</div>'
         '')
     div_html = Div(width=video_width, width_policy="fixed", height=video_height, text=html_string)
 
-    # slash replacement is for Windows/Edge compatability
-    # After changing the source we only need to reset the sync state.
-    # The browser will load the new source and fire canplay automatically,
-    # which triggers the oncanplay handler above to re-synchronise.
-    callback_video = \
-        (BBDV_DOM_HELPER_JS +
-         "const indices = cb_data.index.indices;\n"
-         "if(indices.length > 0){\n"
-         "    const index = indices[0];\n"
-         f'    const videoElement = bbdv_find_element(div, "{unique_html_id}");\n'
-         '    if (videoElement == null) { return; }\n'
-         '    if (!window._bbdvVideos) { window._bbdvVideos = new Set(); }\n'
-         '    window._bbdvVideos.add(videoElement);\n'
-         '    const old_index = videoElement.getAttribute("data-value");\n'
-         '    if(index != old_index){\n'
-         f'        videoElement.src = encodeURI(source.data["{key}"][index].replace(/\\\\/g, "/")).replace(/#/g, "%23");\n'
-         '        videoElement.setAttribute("data-value", index);\n'
-         '        if (window._vSync) { window._vSync = {r: new Set(), ok: false}; }\n'
-         '    }\n'
-         "}")
-
-    return div_html, callback_video
+    return div_html
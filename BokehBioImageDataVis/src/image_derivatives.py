@@ -0,0 +1,103 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os.path import join
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency, only needed for image derivatives
+    Image = None
+    ImageOps = None
+
+IMAGE_DERIVATIVE_FORMATS = ('webp', 'avif', 'jpeg')
+_EXTENSIONS = {'webp': '.webp', 'avif': '.avif', 'jpeg': '.jpg'}
+
+# (source path, output path, max width, max height, format, quality)
+DerivativeJob = Tuple[str, str, Optional[int], Optional[int], str, int]
+
+
+def require_pillow() -> None:
+    if Image is None:
+        raise ImportError('Image derivatives need Pillow, please install it, e.g. with "pip install pillow".')
+
+
+def derivative_extension(image_format: str) -> str:
+    return _EXTENSIONS[image_format]
+
+
+def _to_display_mode(image, image_format: str):
+    # high bit depth images are shown by browsers with their upper 8 bits, do the same here
+    if image.mode in ('I', 'F') or image.mode.startswith('I;16'):
+        pixels = np.asarray(image)
+        if pixels.max(initial=0) > 255:
+            pixels = pixels / 256
+        return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image_format == 'jpeg':
+        return image if image.mode in ('L', 'RGB') else image.convert('RGB')
+    return image if image.mode in ('L', 'LA', 'RGB', 'RGBA') else image.convert('RGBA')
+
+
+def build_image_derivative(job: DerivativeJob) -> str:
+    '''
+    Writes a downscaled, re-encoded copy of an image. May run in worker processes, so it only takes plain arguments.
+    Images are never upscaled, the aspect ratio is kept.
+    '''
+    require_pillow()
+    source_path, output_path, max_width, max_height, image_format, quality = job
+    with Image.open(source_path) as image:
+        target_size = (max_width or image.width, max_height or image.height)
+        # lets the jpeg decoder skip most of the pixels of large images
+        image.draft('RGB', target_size)
+        image = ImageOps.exif_transpose(image)
+        image = _to_display_mode(image, image_format)
+        image.thumbnail(target_size, Image.LANCZOS)
+
+        save_kwargs = {'quality': quality}
+        if image_format == 'jpeg':
+            save_kwargs['optimize'] = True
+        elif image_format == 'webp':
+            save_kwargs['method'] = 4
+
+        # write to a partial file first, an interrupted run must never look like a cached output
+        output_dir, output_filename = os.path.split(output_path)
+        partial_output_path = join(output_dir, f'.partial_{output_filename}')
+        image.save(partial_output_path, format=image_format.upper(), **save_kwargs)
+    os.replace(partial_output_path, output_path)
+    return output_path
+
+
+def run_in_pool(function: Callable[[Any], Any], jobs: List[Any], workers: int = 1, use_processes: bool = False,
+                description: str = 'image derivatives') -> None:
+    if not jobs:
+        return
+    workers = max(1, min(int(workers), len(jobs)))
+    start_time = time.perf_counter()
+    if workers == 1:
+        for job in jobs:
+            function(job)
+    elif use_processes:
+        # processes are not limited by the gil, but under the spawn start method (windows, macos) they re-import
+        # the calling script, which then needs an if __name__ == '__main__' guard
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(function, jobs, chunksize=max(1, len(jobs) // (4 * workers))):
+                pass
+    else:
+        # pillow and the tiff codecs release the gil for most of the decoding and resizing
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(function, jobs):
+                pass
+    logging.info(f'Created {len(jobs)} {description} in {time.perf_counter() - start_time:.1f}s '
+                 f'using {workers} {"process(es)" if use_processes and workers > 1 else "thread(s)"}.')
+
+
+def build_image_derivatives(jobs: List[DerivativeJob], workers: int = 1, use_processes: bool = False) -> None:
+    if jobs:
+        require_pillow()
+    run_in_pool(build_image_derivative, jobs, workers=workers, use_processes=use_processes,
+                description='image derivatives')
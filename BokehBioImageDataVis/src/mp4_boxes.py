@@ -0,0 +1,54 @@
+import os
+import struct
+from typing import Iterator, Optional, Tuple
+
+# top level boxes that can appear in a valid ISO base media file (mp4, mov, m4v)
+_TOP_LEVEL_BOX_TYPES = {b'ftyp', b'styp', b'moov', b'mdat', b'free', b'skip', b'wide', b'uuid', b'pdin', b'moof',
+                        b'mfra', b'meta', b'sidx', b'ssix', b'prft', b'emsg', b'pnot', b'junk', b'jP  '}
+
+
+def iter_top_level_boxes(path: str, max_boxes: int = 64) -> Iterator[Tuple[bytes, int, int]]:
+    '''
+    Yields (type, offset, size) of the top level boxes of an ISO base media file, reading only the box headers.
+    Stops silently at the first header that does not look like a box.
+    '''
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        for _ in range(max_boxes):
+            if offset + 8 > file_size:
+                return
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            box_size, box_type = struct.unpack('>I4s', header)
+            if box_size == 1:
+                # 64 bit size follows the type
+                large_size = f.read(8)
+                if len(large_size) < 8:
+                    return
+                box_size = struct.unpack('>Q', large_size)[0]
+            elif box_size == 0:
+                # box extends to the end of the file
+                box_size = file_size - offset
+            if box_size < 8 or box_type not in _TOP_LEVEL_BOX_TYPES:
+                return
+            yield box_type, offset, box_size
+            offset += box_size
+
+
+def moov_after_mdat(path: str) -> Optional[bool]:
+    '''
+    True if the moov atom comes after the media data, i.e. a browser has to load the whole file before playing it.
+    False if moov comes first, None if the file is not an ISO base media file (or could not be read).
+    '''
+    try:
+        for box_type, _, _ in iter_top_level_boxes(path):
+            if box_type == b'moov':
+                return False
+            if box_type == b'mdat':
+                return True
+    except OSError:
+        return None
+    return None
@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from os.path import abspath, expanduser, join
+from typing import Any, Dict, Optional, Tuple
+
+PROBE_CACHE_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    if sys.platform == 'win32':
+        base_dir = os.environ.get('LOCALAPPDATA') or expanduser('~')
+    elif sys.platform == 'darwin':
+        base_dir = join(expanduser('~'), 'Library', 'Caches')
+    else:
+        base_dir = os.environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache')
+    return join(base_dir, 'BokehBioImageDataVis')
+
+
+class ProbeCache:
+    def __init__(self, cache_path: Optional[str] = None):
+        '''
+        Persistent cache of video probe results (frame size, frame count, fps), stored in a small SQLite database.
+        Entries are keyed by absolute path, size and modification time, so a changed video is probed again.
+        The default location is a per-user cache directory, shared by all exports on this machine.
+        The database is opened on first use. If it can not be opened, results are only cached in memory.
+
+        :param cache_path: path of the SQLite file, defaults to
+            <user cache dir>/BokehBioImageDataVis/probe_cache.sqlite, ':memory:' keeps the cache for the lifetime
+            of this object only
+        '''
+        if cache_path is None:
+            cache_path = join(default_cache_dir(), 'probe_cache.sqlite')
+        self.cache_path = cache_path
+        self.memory_cache: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_attempted = False
+
+    def _connect(self) -> None:
+        # the database is opened on the first probe, exports without videos never touch the user cache directory
+        if self.connection_attempted:
+            return
+        self.connection_attempted = True
+        try:
+            if self.cache_path != ':memory:':
+                os.makedirs(os.path.dirname(abspath(self.cache_path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=30)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS probes ('
+                'path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, version INTEGER NOT NULL, '
+                'info TEXT NOT NULL, PRIMARY KEY (path, size, mtime_ns, version))'
+            )
+            self.connection.commit()
+        except (OSError, sqlite3.Error) as exc:
+            logging.warning(f'Could not open video probe cache {self.cache_path}, caching in memory only. '
+                            f'Reason: {exc}')
+            self.connection = None
+
+    def get(self, path: str, signature: Optional[Dict[str, int]]) -> Optional[Dict[str, Any]]:
+        if signature is None:
+            return None
+        key = (abspath(path), signature['size'], signature['mtime_ns'])
+        with self.lock:
+            if key in self.memory_cache:
+                return dict(self.memory_cache[key])
+            self._connect()
+            if self.connection is None:
+                return None
+            try:
+                row = self.connection.execute(
+                    'SELECT info FROM probes WHERE path = ? AND size = ? AND mtime_ns = ? AND version = ?',
+                    key + (PROBE_CACHE_VERSION,)
+                ).fetchone()
+            except sqlite3.Error as exc:
+                logging.debug(f'Video probe cache lookup failed: {exc}')
+                return None
+            if row is None:
+                return None
+            info = json.loads(row[0])
+            self.memory_cache[key] = info
+            return dict(info)
+
+    def set(self, path: str, signature: Optional[Dict[str, int]], info: Dict[str, Any]) -> None:
+        if signature is None:
+            return
+        key = (abspath(path), signature['size'], signature['mtime_ns'])
+        with self.lock:
+            self.memory_cache[key] = dict(info)
+            self._connect()
+            if self.connection is None:
+                return
+            try:
+                # older results for the same path are outdated now
+                self.connection.execute('DELETE FROM probes WHERE path = ?', (key[0],))
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO probes (path, size, mtime_ns, version, info) VALUES (?, ?, ?, ?, ?)',
+                    key + (PROBE_CACHE_VERSION, json.dumps(info))
+                )
+                self.connection.commit()
+            except sqlite3.Error as exc:
+                logging.debug(f'Could not store video probe result: {exc}')
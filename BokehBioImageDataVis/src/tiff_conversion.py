@@ -0,0 +1,169 @@
+import os
+from os.path import join
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:  # optional dependency, only needed for tiff images
+    tifffile = None
+
+from BokehBioImageDataVis.src.image_derivatives import require_pillow
+
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+Z_PROJECTIONS = ('max', 'middle')
+CHANNEL_COLORS = {
+    'gray': (1.0, 1.0, 1.0),
+    'red': (1.0, 0.0, 0.0),
+    'green': (0.0, 1.0, 0.0),
+    'blue': (0.0, 0.0, 1.0),
+    'cyan': (0.0, 1.0, 1.0),
+    'magenta': (1.0, 0.0, 1.0),
+    'yellow': (1.0, 1.0, 0.0),
+}
+_DEFAULT_CHANNEL_COLORS = {
+    1: ['gray'],
+    2: ['green', 'magenta'],
+    3: ['red', 'green', 'blue'],
+}
+_CYCLED_CHANNEL_COLORS = ['cyan', 'magenta', 'yellow', 'red', 'green', 'blue']
+# percentiles of large planes are estimated from a subsample with about this many pixels
+_PERCENTILE_SAMPLE_SIZE = 1 << 20
+
+# (source path, output path, settings)
+TiffJob = Tuple[str, str, Dict[str, Any]]
+
+
+def require_tifffile() -> None:
+    if tifffile is None:
+        raise ImportError('TIFF images need tifffile, please install it, e.g. with "pip install tifffile".')
+
+
+def is_tiff_path(path: str) -> bool:
+    return path.lower().endswith(TIFF_EXTENSIONS)
+
+
+def parse_channel_color(color) -> Tuple[float, float, float]:
+    if isinstance(color, str):
+        if color in CHANNEL_COLORS:
+            return CHANNEL_COLORS[color]
+        if color.startswith('#') and len(color) == 7:
+            return tuple(int(color[i:i + 2], 16) / 255 for i in (1, 3, 5))
+        raise ValueError(f'Unknown channel color {color}, use one of {list(CHANNEL_COLORS)} or #rrggbb.')
+    if len(color) != 3:
+        raise ValueError(f'Channel colors must be names, #rrggbb or (r, g, b) tuples in [0, 1], got {color}.')
+    return tuple(float(value) for value in color)
+
+
+def normalize_contrast_limits(contrast_limits) -> Optional[List[Any]]:
+    # either one (low, high) pair for all channels or one pair per channel
+    if contrast_limits is None:
+        return None
+    contrast_limits = np.asarray(contrast_limits, dtype=float)
+    if contrast_limits.shape[-1] != 2 or contrast_limits.ndim not in (1, 2):
+        raise ValueError(f'contrast_limits must be (low, high) or a list of (low, high) per channel, '
+                         f'got {contrast_limits.tolist()}.')
+    return contrast_limits.tolist()
+
+
+def _channel_colors(channel_colors: Optional[Sequence[Any]], n_channels: int) -> List[Tuple[float, float, float]]:
+    if channel_colors is None:
+        channel_colors = _DEFAULT_CHANNEL_COLORS.get(
+            n_channels, [_CYCLED_CHANNEL_COLORS[i % len(_CYCLED_CHANNEL_COLORS)] for i in range(n_channels)])
+    if len(channel_colors) < n_channels:
+        raise ValueError(f'Got {len(channel_colors)} channel colors for an image with {n_channels} channels.')
+    return [parse_channel_color(color) for color in channel_colors[:n_channels]]
+
+
+def _open_memmapped(tif) -> np.ndarray:
+    # uncompressed files are mapped directly; everything else is decoded into a temporary memmap, so large stacks
+    # never have to fit into memory
+    try:
+        return tifffile.memmap(tif.filehandle.path, series=0, mode='r')
+    except (ValueError, OSError):
+        return tif.series[0].asarray(out='memmap')
+
+
+def _to_zcyx(data: np.ndarray, axes: str) -> np.ndarray:
+    '''
+    Brings an image with tifffile axes (e.g. 'TZCYX', 'IYX', 'YXS') into ZCYX order without copying.
+    Other axes (time, series, ...) are reduced to their first entry.
+    '''
+    axes = axes.upper()
+    if 'Z' not in axes:
+        # plain multi page tiffs have an unspecified image sequence axis, which usually is z
+        for candidate in ('Q', 'I'):
+            if candidate in axes:
+                axes = axes.replace(candidate, 'Z', 1)
+                break
+    if 'C' not in axes and 'S' in axes:
+        axes = axes.replace('S', 'C', 1)
+
+    index = tuple(slice(None) if axis in 'ZCYX' else 0 for axis in axes)
+    data = data[index]
+    kept_axes = ''.join(axis for axis in axes if axis in 'ZCYX')
+    for axis in 'ZC':
+        if axis not in kept_axes:
+            data = data[np.newaxis]
+            kept_axes = axis + kept_axes
+    return np.transpose(data, [kept_axes.index(axis) for axis in 'ZCYX'])
+
+
+def _project_channel(channel_stack: np.ndarray, z_projection: str) -> np.ndarray:
+    if z_projection == 'middle' or channel_stack.shape[0] == 1:
+        return np.asarray(channel_stack[channel_stack.shape[0] // 2])
+    # plane by plane, so only two planes are in memory at a time
+    projection = np.array(channel_stack[0])
+    for plane in channel_stack[1:]:
+        np.maximum(projection, plane, out=projection)
+    return projection
+
+
+def _channel_limits(plane: np.ndarray, channel_index: int, contrast_limits,
+                    contrast_percentiles) -> Tuple[float, float]:
+    if contrast_limits is not None:
+        if np.ndim(contrast_limits) == 1:
+            return float(contrast_limits[0]), float(contrast_limits[1])
+        return float(contrast_limits[channel_index][0]), float(contrast_limits[channel_index][1])
+    step = max(1, int(np.sqrt(plane.size / _PERCENTILE_SAMPLE_SIZE)))
+    low, high = np.percentile(plane[::step, ::step], contrast_percentiles)
+    return float(low), float(high)
+
+
+def convert_tiff_for_display(job: TiffJob) -> str:
+    '''
+    Renders a (multi channel, z-stack) tiff into an 8 bit RGB png: every channel is max projected along z,
+    scaled to its contrast limits, colored and added up. May run in worker processes, so it only takes plain arguments.
+    '''
+    require_tifffile()
+    require_pillow()
+    from PIL import Image
+
+    source_path, output_path, settings = job
+    with tifffile.TiffFile(source_path) as tif:
+        axes = tif.series[0].axes
+        data = _to_zcyx(_open_memmapped(tif), axes)
+        n_channels = data.shape[1]
+        colors = _channel_colors(settings.get('channel_colors'), n_channels)
+
+        rgb = np.zeros(data.shape[2:] + (3,), dtype=np.float32)
+        for channel_index in range(n_channels):
+            plane = _project_channel(data[:, channel_index], settings.get('z_projection', 'max'))
+            low, high = _channel_limits(plane, channel_index, settings.get('contrast_limits'),
+                                        settings.get('contrast_percentiles', (0.1, 99.9)))
+            scaled = (plane.astype(np.float32) - low) / max(high - low, np.finfo(np.float32).eps)
+            np.clip(scaled, 0, 1, out=scaled)
+            rgb += scaled[..., np.newaxis] * np.asarray(colors[channel_index], dtype=np.float32)
+        del data
+
+    np.clip(rgb, 0, 1, out=rgb)
+    pixels = (rgb * 255 + 0.5).astype(np.uint8)
+    image = Image.fromarray(pixels[..., 0] if n_channels == 1 and colors[0] == (1.0, 1.0, 1.0) else pixels)
+
+    # write to a partial file first, an interrupted run must never look like a cached output
+    output_dir, output_filename = os.path.split(output_path)
+    partial_output_path = join(output_dir, f'.partial_{output_filename}')
+    image.save(partial_output_path, format='PNG')
+    os.replace(partial_output_path, output_path)
+    return output_path
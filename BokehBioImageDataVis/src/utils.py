@@ -1,3 +1,4 @@
+import numpy as np
 from pandas.api.types import is_numeric_dtype, is_float_dtype
 import logging
 def detect_if_key_is_float(df, key):
@@ -24,6 +25,40 @@ def identify_numerical_variables(df):
             numeric_options.append(key)
     return numeric_options
 
+# smallest first, bokeh serializes all of these as binary arrays
+_COMPACT_INTEGER_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+
+def _compact_column(values, float_tolerance):
+    if values.dtype.kind == 'f' and values.dtype.itemsize > 4:
+        compact_values = values.astype(np.float32)
+        if np.allclose(compact_values.astype(values.dtype), values, rtol=0, atol=float_tolerance, equal_nan=True):
+            return compact_values
+    elif values.dtype.kind in 'iu' and len(values) > 0:
+        low, high = values.min(), values.max()
+        for dtype in _COMPACT_INTEGER_DTYPES:
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return values.astype(dtype) if np.dtype(dtype).itemsize < values.dtype.itemsize else values
+    return values
+
+
+def compact_numeric_columns(df, float_tolerance):
+    # float columns become float32 if no value changes by more than float_tolerance, integer columns get the smallest
+    # integer type that holds their range. Returns a shallow copy, df itself is not changed.
+    compact_df = df.copy(deep=False)
+    bytes_before = bytes_after = 0
+    for key in df.columns:
+        values = df[key].to_numpy()
+        if not isinstance(values, np.ndarray) or values.dtype.kind not in 'iuf':
+            continue
+        compact_values = _compact_column(values, float_tolerance)
+        bytes_before += values.nbytes
+        bytes_after += compact_values.nbytes
+        if compact_values is not values:
+            compact_df[key] = compact_values
+    logging.debug(f'Compacted numeric columns from {bytes_before / 1e6:.1f} MB to {bytes_after / 1e6:.1f} MB.')
+    return compact_df
+
 def download_files_simple_example_1():
     # download files needed to run simple example 1
     # https://github.com/JoeGreiner/BokehBioImageDataVis/tree/main/examples/simple_1/data/pictures/cat1.jpg
@@ -18,6 +18,10 @@ setup(name='BokehBioImageDataVis',
           'requests',
           'ffmpeg-python',
       ],
+      extras_require={
+          'images': ['pillow'],
+          'tiff': ['pillow', 'tifffile'],
+      },
       package_data={
         'BokehBioImageDataVis': ['resources/*.png', 'resources/*.mp4']
         },